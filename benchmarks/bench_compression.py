@@ -0,0 +1,102 @@
+"""
+Measure message compression on a history database.
+
+Reports the stored size of message content as plain text, zstd without a
+dictionary and zstd with a dictionary trained on the corpus, plus the cost of
+decompressing a row on read.
+
+Usage:
+    python benchmarks/bench_compression.py [--db history.db] [--limit 20000]
+
+Without a database (or with an empty one) a synthetic corpus of repetitive
+assistant and tool output is used instead.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.memory.codec import MessageCodec, train_dictionary, zstd
+
+
+def load_corpus(db_path: str, limit: int):
+    if not os.path.exists(db_path):
+        return []
+    db = sqlite3.connect(db_path)
+    try:
+        columns = [row[1] for row in db.execute("PRAGMA table_info(messages)")]
+        codec_col = "codec" if "codec" in columns else "NULL"
+        rows = db.execute(f"SELECT content, {codec_col} FROM messages ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        dicts = {}
+        if codec_col == "codec":
+            dicts = dict(db.execute("SELECT id, data FROM compression_dicts").fetchall())
+    finally:
+        db.close()
+
+    reader = MessageCodec()
+    for dict_id, data in dicts.items():
+        reader.add_dict(dict_id, data)
+    return [reader.decode(content, codec) for content, codec in rows if content]
+
+
+def synthetic_corpus(n: int):
+    rng = random.Random(0)
+    words = ["file", "directory", "result", "status", "error", "query", "tool", "server", "value", "item"]
+    corpus = []
+    for i in range(n):
+        body = " ".join(rng.choice(words) for _ in range(rng.randint(40, 200)))
+        corpus.append(f"Here is the result of the `{rng.choice(words)}` tool call:\n```json\n{{\"status\": \"ok\", \"id\": {i}, \"text\": \"{body}\"}}\n```")
+    return corpus
+
+
+def measure(codec: MessageCodec, corpus):
+    encoded = [codec.encode(text) for text in corpus]
+    stored = sum(len(value if isinstance(value, bytes) else value.encode("utf-8")) for value, _ in encoded)
+
+    start = time.perf_counter()
+    for value, tag in encoded:
+        codec.decode(value, tag)
+    elapsed = time.perf_counter() - start
+    return stored, elapsed / len(encoded) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="history.db")
+    parser.add_argument("--limit", type=int, default=20000)
+    parser.add_argument("--dict-size", type=int, default=112640)
+    parser.add_argument("--level", type=int, default=3)
+    args = parser.parse_args()
+
+    if zstd is None:
+        sys.exit("zstandard is not installed")
+
+    corpus = load_corpus(args.db, args.limit)
+    source = args.db
+    if len(corpus) < 100:
+        corpus = synthetic_corpus(5000)
+        source = "synthetic"
+
+    # Train on half the corpus and measure on the other half
+    random.Random(1).shuffle(corpus)
+    train, test = corpus[: len(corpus) // 2], corpus[len(corpus) // 2:]
+    raw = sum(len(text.encode("utf-8")) for text in test)
+
+    plain_codec = MessageCodec(enabled=True, level=args.level, min_bytes=0)
+    dict_codec = MessageCodec(enabled=True, level=args.level, min_bytes=0)
+    dict_codec.add_dict(1, train_dictionary(train, args.dict_size))
+
+    print(f"Corpus: {source}, {len(test)} messages, {raw / 1024:.1f} KiB")
+    print(f"{'format':<16}{'size KiB':>12}{'ratio':>10}{'decode us/row':>16}")
+    print(f"{'plain':<16}{raw / 1024:>12.1f}{1.0:>10.2f}{0.0:>16.2f}")
+    for name, codec in (("zstd", plain_codec), ("zstd+dict", dict_codec)):
+        stored, decode_us = measure(codec, test)
+        print(f"{name:<16}{stored / 1024:>12.1f}{raw / stored:>10.2f}{decode_us:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
 import typer
 import asyncio
+import sys
+from typing import List, Optional
 from rich.console import Console
 from rich.markdown import Markdown
 from rich.live import Live
-from core.chat_engine import ChatEngine
+from rich.table import Table
+from core.config import settings
+from core.chat_engine import ChatEngine, create_llm
+from core.batch import BatchRunner
+from core.mcp.client import MCPClientManager
+from core.memory.manager import MemoryManager
+from core.memory.vector_index import get_vector_index
 
 app = typer.Typer()
 console = Console()
@@ -39,6 +47,163 @@ def chat():
     """
     asyncio.run(chat_loop())
 
+async def run_batch(input_path: str, output_path: str, concurrency: int):
+    await MemoryManager().init_db()
+    mcp = MCPClientManager()
+    await mcp.connect_all()
+    try:
+        provider = settings.DEFAULT_LLM_PROVIDER
+        runner = BatchRunner(create_llm(provider), mcp, concurrency=concurrency, provider=provider)
+        return await runner.run(input_path, output_path)
+    finally:
+        await mcp.cleanup()
+
+@app.command()
+def batch(
+    input_path: str = typer.Argument(..., help="JSONL file of prompts ({\"id\": ..., \"prompt\": ...} per line)."),
+    output_path: str = typer.Argument(..., help="JSONL file to append results to. Also used to resume."),
+    concurrency: int = typer.Option(4, help="Prompts processed at once."),
+    rpm: Optional[int] = typer.Option(None, help="Requests per minute. Overrides PROVIDER_RPM for the active provider."),
+    tpm: Optional[int] = typer.Option(None, help="Tokens per minute. Overrides PROVIDER_TPM for the active provider."),
+):
+    """
+    Run prompts from a JSONL file through the chat engine.
+    """
+    provider = settings.DEFAULT_LLM_PROVIDER
+    if rpm:
+        settings.PROVIDER_RPM = {**settings.PROVIDER_RPM, provider: rpm}
+    if tpm:
+        settings.PROVIDER_TPM = {**settings.PROVIDER_TPM, provider: tpm}
+    summary = asyncio.run(run_batch(input_path, output_path, concurrency))
+
+    table = Table(title="Batch Summary")
+    table.add_column("Metric")
+    table.add_column("Value", justify="right")
+    table.add_row("Completed", str(summary.completed))
+    table.add_row("Failed", str(summary.failed))
+    table.add_row("Skipped (already done)", str(summary.skipped))
+    table.add_row("Elapsed", f"{summary.elapsed:.1f}s")
+    table.add_row("Throughput", f"{summary.throughput:.2f} prompts/s")
+    table.add_row("Latency p50", f"{summary.percentile(50):.0f} ms")
+    table.add_row("Latency p95", f"{summary.percentile(95):.0f} ms")
+    table.add_row("Latency max", f"{max(summary.latencies, default=0):.0f} ms")
+    console.print(table)
+
+async def export_history(output: str, conversation_ids: Optional[List[int]], before: Optional[str]):
+    memory = MemoryManager()
+    await memory.init_db()
+    count = 0
+    out = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+    try:
+        async for line in memory.export_conversations(conversation_ids or None, before=before):
+            out.write(line)
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return count
+
+@app.command()
+def export(
+    output: str = typer.Option("-", "--output", "-o", help="NDJSON file to write, '-' for stdout."),
+    conversation_id: Optional[List[int]] = typer.Option(None, "--conversation-id", "-c", help="Conversation to export (repeatable)."),
+    before: Optional[str] = typer.Option(None, help="Only export conversations created before this timestamp."),
+):
+    """
+    Export conversations as NDJSON.
+    """
+    count = asyncio.run(export_history(output, conversation_id, before))
+    Console(stderr=True).print(f"[green]Exported {count} conversations[/green]")
+
+async def import_history(path: str, batch_size: int) -> int:
+    memory = MemoryManager()
+    await memory.init_db()
+    if path == "-":
+        return await memory.import_conversations(sys.stdin, batch_size=batch_size)
+    with open(path, "r", encoding="utf-8") as f:
+        return await memory.import_conversations(f, batch_size=batch_size)
+
+@app.command("import")
+def import_(
+    path: str = typer.Argument(..., help="NDJSON file to import, '-' for stdin."),
+    batch_size: int = typer.Option(500, help="Messages per executemany batch."),
+):
+    """
+    Import conversations from an NDJSON export.
+    """
+    count = asyncio.run(import_history(path, batch_size))
+    console.print(f"[green]Imported {count} conversations[/green]")
+
+async def archive_history(days: int, archive_path: str) -> int:
+    memory = MemoryManager()
+    await memory.init_db()
+    archived = await memory.archive_conversations(days, archive_path)
+    await memory.gc_blobs()
+    return archived
+
+@app.command()
+def archive(
+    days: int = typer.Option(..., help="Archive conversations with no activity in this many days."),
+    archive_path: str = typer.Option("archive/history.ndjson.gz", "--archive", help="Compressed archive to append to."),
+):
+    """
+    Move old conversations to a compressed archive and reclaim space.
+    """
+    count = asyncio.run(archive_history(days, archive_path))
+    console.print(f"[green]Archived {count} conversations to {archive_path}[/green]")
+
+async def collect_blobs(grace_seconds: float) -> int:
+    memory = MemoryManager()
+    await memory.init_db()
+    return await memory.gc_blobs(grace_seconds=grace_seconds)
+
+@app.command()
+def gc(
+    grace_seconds: float = typer.Option(3600, help="Keep unreferenced blobs written within this many seconds."),
+):
+    """
+    Delete spilled tool results no longer referenced by any message.
+    """
+    count = asyncio.run(collect_blobs(grace_seconds))
+    console.print(f"[green]Deleted {count} unreferenced blobs from {settings.BLOB_STORE_PATH}[/green]")
+
+async def compress_history(train: bool, sample_limit: int, batch_size: int):
+    memory = MemoryManager(compression="zstd")
+    await memory.init_db()
+    if train:
+        dict_id = await memory.train_compression_dict(sample_limit=sample_limit)
+        console.print(f"Trained compression dictionary {dict_id}")
+    return await memory.recompress_messages(batch_size=batch_size)
+
+@app.command()
+def compress(
+    train: bool = typer.Option(True, help="Train a new dictionary on existing messages first."),
+    sample_limit: int = typer.Option(5000, help="Number of recent messages to train on."),
+    batch_size: int = typer.Option(500, help="Rows rewritten per transaction."),
+):
+    """
+    Recompress stored messages with zstd (set MESSAGE_COMPRESSION=zstd to compress new messages too).
+    """
+    count = asyncio.run(compress_history(train, sample_limit, batch_size))
+    console.print(f"[green]Recompressed {count} messages[/green]")
+
+async def rebuild_index(batch_size: int) -> int:
+    memory = MemoryManager()
+    await memory.init_db()
+    index = get_vector_index(settings.SEMANTIC_MEMORY_PATH)
+    await index.clear()
+    return await memory.index_conversations(index=index, batch_size=batch_size)
+
+@app.command()
+def reindex(
+    batch_size: int = typer.Option(256, help="Messages embedded per batch."),
+):
+    """
+    Rebuild the semantic memory index from the stored history.
+    """
+    chunks = asyncio.run(rebuild_index(batch_size))
+    console.print(f"[green]Indexed {chunks} chunks into {settings.SEMANTIC_MEMORY_PATH}[/green]")
+
 @app.command()
 def serve():
     """
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from core.chat_engine import ChatEngine
+from core.config import settings
+from core.llm.base import BaseLLM
+from core.llm.rate_limit import RateLimitedLLM, get_provider_limiter
+from core.mcp.client import MCPClientManager
+from core.mcp.scheduler import PRIORITY_BACKGROUND
+from core.memory.vector_index import get_vector_index
+
+
+@dataclass
+class BatchSummary:
+    completed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        return (self.completed + self.failed) / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, pct: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+def read_prompts(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream prompts from a JSONL file. Each line is either an object with a
+    `prompt` field (and optional `id` and `conversation_id`) or a bare JSON
+    string. Items without an id are numbered by line.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"prompt": record}
+            record.setdefault("id", line_no)
+            yield record
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """
+    Ids that already have a successful result in the output file. The output
+    file doubles as the checkpoint; failed items are retried on resume.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Partial line from a crash mid-write
+                continue
+            if "response" in record:
+                done.add(str(record["id"]))
+    return done
+
+
+class BatchRunner:
+    """
+    Run prompts from a JSONL file through ChatEngine with bounded
+    concurrency and incremental, resumable output.
+
+    Every LLM call (including each tool round) is admitted through the
+    provider's shared limiter (PROVIDER_RPM / PROVIDER_TPM) as one "batch"
+    flow, so a run is rate-limited together with other traffic in the process.
+    """
+
+    def __init__(
+        self,
+        llm: BaseLLM,
+        mcp: MCPClientManager,
+        concurrency: int = 4,
+        provider: Optional[str] = None,
+    ):
+        if not isinstance(llm, RateLimitedLLM):
+            llm = RateLimitedLLM(llm, get_provider_limiter(provider or settings.DEFAULT_LLM_PROVIDER))
+        self.llm = llm
+        self.mcp = mcp
+        self.concurrency = max(1, concurrency)
+
+    async def _run_one(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.monotonic()
+        # Offline work yields MCP server slots to interactive chats
+        engine = ChatEngine(
+            conversation_id=item.get("conversation_id"),
+            llm=self.llm.for_flow("batch"),
+            mcp=self.mcp,
+            tool_priority=PRIORITY_BACKGROUND
+        )
+        await engine.initialize()
+        response = ""
+        async for chunk in engine.chat(item["prompt"]):
+            response += chunk
+        return {
+            "id": item["id"],
+            "conversation_id": engine.conversation_id,
+            "response": response,
+            "latency_ms": round((time.monotonic() - start) * 1000, 1),
+        }
+
+    async def run(self, input_path: str, output_path: str) -> BatchSummary:
+        summary = BatchSummary()
+        done = completed_ids(output_path)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        start = time.monotonic()
+
+        with open(output_path, "a", encoding="utf-8") as out:
+            def write(record: Dict[str, Any]):
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+
+            async def worker():
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    try:
+                        result = await self._run_one(item)
+                    except Exception as e:
+                        summary.failed += 1
+                        write({"id": item["id"], "error": str(e)})
+                    else:
+                        summary.completed += 1
+                        summary.latencies.append(result["latency_ms"])
+                        write(result)
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                for item in read_prompts(input_path):
+                    if str(item["id"]) in done:
+                        summary.skipped += 1
+                        continue
+                    await queue.put(item)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+                if settings.SEMANTIC_MEMORY_ENABLED:
+                    # Index messages still queued before the event loop goes away
+                    await get_vector_index(settings.SEMANTIC_MEMORY_PATH).close()
+
+        summary.elapsed = time.monotonic() - start
+        return summary
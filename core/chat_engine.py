@@ -1,34 +1,64 @@
+import asyncio
 import json
-from typing import AsyncGenerator, List, Dict, Any, Optional
+from typing import AsyncGenerator, List, Dict, Any, Optional, Tuple
 from core.config import settings
 from core.llm.base import BaseLLM
 from core.llm.local import LocalLLM
 from core.llm.cloud import OpenAILLM, GeminiLLM, AnthropicLLM
 from core.memory.manager import MemoryManager
+from core.memory.vector_index import VectorIndex, get_vector_index
+from core.llm.rate_limit import estimate_tokens
 from core.mcp.client import MCPClientManager
+from core.mcp.scheduler import PRIORITY_INTERACTIVE
+from core.tool_calls import ToolCall, ToolCallParser, parse_tool_calls, format_tool_result
+
+SYSTEM_PROMPT = "You are a helpful AI assistant."
+
+def create_llm(provider: Optional[str] = None) -> BaseLLM:
+    provider = provider or settings.DEFAULT_LLM_PROVIDER
+    if provider == "openai":
+        return OpenAILLM()
+    elif provider == "gemini":
+        return GeminiLLM()
+    elif provider == "anthropic":
+        return AnthropicLLM()
+    return LocalLLM()
 
 class ChatEngine:
-    def __init__(self, conversation_id: Optional[int] = None, llm: Optional[BaseLLM] = None, mcp: Optional[MCPClientManager] = None):
-        self.memory = MemoryManager()
+    def __init__(
+        self,
+        conversation_id: Optional[int] = None,
+        llm: Optional[BaseLLM] = None,
+        mcp: Optional[MCPClientManager] = None,
+        memory: Optional[MemoryManager] = None,
+        semantic: Optional[VectorIndex] = None,
+        tool_priority: int = PRIORITY_INTERACTIVE
+    ):
+        self.memory = memory or MemoryManager()
+        if semantic is None and settings.SEMANTIC_MEMORY_ENABLED:
+            semantic = get_vector_index(settings.SEMANTIC_MEMORY_PATH)
+        self.semantic = semantic
         self.mcp = mcp or MCPClientManager()
         self.llm = llm
         self.conversation_id = conversation_id
+        # Scheduler priority for this engine's tool calls (lower runs first)
+        self.tool_priority = tool_priority
+        # Warm state, kept in sync with memory so long-lived engines skip reloading history
+        self.history: Optional[List[Dict[str, str]]] = None
+        self.history_chars = 0
+        # Spilled tool results (handle -> full text) the model still sees in full this turn
+        self._turn_results: Dict[str, str] = {}
+        # Tool selection computed by estimate_prompt_tokens, keyed by (history length, message)
+        self._estimated_tools: Optional[Tuple[int, str, List[Dict[str, Any]]]] = None
 
     async def initialize(self):
-        await self.memory.init_db()
+        await self.memory.ensure_db()
         if not self.mcp.sessions: # Only connect if not already connected (naive check)
             await self.mcp.connect_all()
         
         # Initialize LLM based on settings if not provided
         if not self.llm:
-            if settings.DEFAULT_LLM_PROVIDER == "openai":
-                self.llm = OpenAILLM()
-            elif settings.DEFAULT_LLM_PROVIDER == "gemini":
-                self.llm = GeminiLLM()
-            elif settings.DEFAULT_LLM_PROVIDER == "anthropic":
-                self.llm = AnthropicLLM()
-            else:
-                self.llm = LocalLLM()
+            self.llm = create_llm()
 
         if self.conversation_id is None:
             self.conversation_id = await self.memory.create_conversation()
@@ -37,34 +67,232 @@ class ChatEngine:
         if not self.llm:
             await self.initialize()
 
-        # Add user message to memory
-        await self.memory.add_message(self.conversation_id, "user", message)
-
-        # Get history
-        history = await self.memory.get_messages(self.conversation_id)
+        # Get history, then add the user message to memory
+        self._turn_results = {}
+        history = await self._load_history()
+        await self._remember("user", message)
+        turn_start = len(history) - 1
         
         # Get tools (for system prompt or function calling)
+        estimated, self._estimated_tools = self._estimated_tools, None
+        if estimated and estimated[:2] == (turn_start, message):
+            tools = estimated[2]
+        else:
+            tools = await self._select_tools(history, turn_start)
+        system_prompt = self._system_prompt(tools)
+
+        # With semantic memory, older turns are replaced by the snippets most relevant to this message
+        if self.semantic:
+            snippets = await self._recall(message, self._window(history, turn_start))
+            if snippets:
+                system_prompt += "\n\nRelevant context from earlier messages:\n" + "\n".join(snippets)
+
+        for round_no in range(settings.MAX_TOOL_ROUNDS + 1):
+            # Stream response, dispatching read-only tool calls as soon as their JSON closes
+            parser = ToolCallParser()
+            speculative: Dict[str, asyncio.Task] = {}
+            full_response = ""
+            try:
+                messages = self._llm_messages(self._window(history, turn_start))
+                async for chunk in self.llm.chat_stream(messages, system_prompt=system_prompt):
+                    full_response += chunk
+                    yield chunk
+                    if not settings.SPECULATIVE_TOOL_DISPATCH:
+                        continue
+                    for call in parser.feed(chunk):
+                        call = self._resolve_call(call, tools)
+                        if call and call.key not in speculative and self._is_read_only(call, tools):
+                            speculative[call.key] = asyncio.create_task(self._run_tool(call))
+
+                # Add assistant response to memory
+                await self._remember("assistant", full_response)
+
+                # Only calls present in the final message, against offered tools, are confirmed
+                confirmed = []
+                for call in parse_tool_calls(full_response):
+                    call = self._resolve_call(call, tools)
+                    if call and call.key not in {c.key for c in confirmed}:
+                        confirmed.append(call)
+                confirmed_keys = {c.key for c in confirmed}
+                for key, task in speculative.items():
+                    if key not in confirmed_keys:
+                        task.cancel()
+
+                if not confirmed or round_no == settings.MAX_TOOL_ROUNDS:
+                    self._turn_results = {}
+                    break
+
+                # ReAct loop: run confirmed calls, record results, and let the model continue
+                for call in confirmed:
+                    task = speculative.get(call.key)
+                    result = await task if task else await self._run_tool(call)
+                    await self._remember("tool", f"Result of {call.server}/{call.tool}:\n{result}")
+                    yield f"\n\n*Used tool `{call.server}/{call.tool}`*\n\n"
+            finally:
+                # Stops calls never confirmed or awaited, e.g. when the client disconnects
+                for task in speculative.values():
+                    task.cancel()
+
+    async def estimate_prompt_tokens(self, message: str) -> int:
+        """
+        Estimated prompt tokens for the first model call of a turn on `message`:
+        the system prompt with its tool schemas, the replayed history and the
+        message. Nothing is stored.
+        """
+        history = await self._load_history()
+        pending = history + [{"role": "user", "content": message}]
+        turn_start = len(history)
+        tools = await self._select_tools(pending, turn_start)
+        # chat() reuses this selection for the same turn
+        self._estimated_tools = (turn_start, message, tools)
+        system_prompt = self._system_prompt(tools)
+        prompt = system_prompt + "".join(msg["content"] for msg in self._llm_messages(self._window(pending, turn_start)))
+        tokens = estimate_tokens(prompt)
+        if self.semantic:
+            tokens += settings.SEMANTIC_MEMORY_TOKEN_BUDGET
+        return tokens
+
+    async def default_system_prompt(self) -> str:
+        """
+        System prompt for a message that matches no tool in particular (pinned,
+        recently used and leading catalog tools). Used to warm the model's
+        prompt cache with the prefix real turns start with.
+        """
+        return self._system_prompt(await self._select_tools([{"role": "user", "content": ""}], 0))
+
+    async def _select_tools(self, history: List[Dict[str, str]], turn_start: int) -> List[Dict[str, Any]]:
         tools = await self.mcp.list_tools()
-        
+        top_k = settings.TOOL_SELECTION_TOP_K
+        if top_k and len(tools) > top_k + len(settings.TOOL_SELECTION_PINNED):
+            tools = self.mcp.select_tools(tools, self._tool_query(history, turn_start), top_k, settings.TOOL_SELECTION_PINNED)
+        return tools
+
+    def _system_prompt(self, tools: List[Dict[str, Any]]) -> str:
         # Construct system prompt with tools info
         # This is a naive implementation for local LLMs. 
         # Advanced models would use native tool calling.
-        system_prompt = "You are a helpful AI assistant."
+        system_prompt = SYSTEM_PROMPT
         if tools:
             tools_json = json.dumps(tools, indent=2)
             system_prompt += f"\n\nAvailable Tools:\n{tools_json}\n\nTo use a tool, output a JSON block like:\n```json\n{{\"tool\": \"tool_name\", \"server\": \"server_name\", \"arguments\": {{...}}}}\n```"
+        return system_prompt
 
-        # Stream response
-        full_response = ""
-        async for chunk in self.llm.chat_stream(history, system_prompt=system_prompt):
-            full_response += chunk
-            yield chunk
+    async def _load_history(self) -> List[Dict[str, str]]:
+        if self.history is None:
+            self.history = await self.memory.get_messages(self.conversation_id)
+            self.history_chars = sum(len(msg["content"]) for msg in self.history)
+        return self.history
+
+    async def _remember(self, role: str, content: str):
+        stored = await self.memory.add_message(self.conversation_id, role, content)
+        if self.history is not None:
+            self.history.append({"role": role, "content": stored})
+            self.history_chars += len(stored)
+        if stored != content:
+            # Later turns get the compact handle; the rest of this turn needs the whole result
+            self._turn_results[stored] = content
+        if self.semantic:
+            self.semantic.add(self.conversation_id, role, content)
+
+    def _tool_query(self, history: List[Dict[str, str]], turn_start: int) -> str:
+        """
+        The new message plus the previous user and assistant turns, so
+        follow-ups like "same for b.txt" still match the tools in play.
+        """
+        earlier = [msg["content"] for msg in history[:turn_start] if msg["role"] in ("user", "assistant")]
+        return "\n".join(earlier[-2:] + [history[turn_start]["content"]])
+
+    def _window(self, history: List[Dict[str, str]], turn_start: int) -> List[Dict[str, str]]:
+        """
+        Messages sent to the model: everything without semantic memory,
+        otherwise the current turn plus the most recent earlier messages.
+        """
+        if not self.semantic:
+            return history
+        start = min(turn_start, max(0, len(history) - settings.SEMANTIC_MEMORY_RECENT_MESSAGES))
+        # Start on a user turn; some providers reject a leading assistant message
+        while start < turn_start and history[start]["role"] == "assistant":
+            start += 1
+        return history[start:]
+
+    async def _recall(self, message: str, window: List[Dict[str, str]]) -> List[str]:
+        """
+        Past snippets relevant to `message` that fit in SEMANTIC_MEMORY_TOKEN_BUDGET,
+        skipping text already in the window.
+        """
+        scope = [self.conversation_id] if settings.SEMANTIC_MEMORY_SCOPE == "conversation" else None
+        try:
+            results = await self.semantic.search(
+                message,
+                k=settings.SEMANTIC_MEMORY_TOP_K,
+                min_score=settings.SEMANTIC_MEMORY_MIN_SCORE,
+                conversation_ids=scope
+            )
+        except Exception as e:
+            print(f"Semantic memory search failed: {e}")
+            return []
+        snippets = []
+        budget = settings.SEMANTIC_MEMORY_TOKEN_BUDGET
+        for result in results:
+            if any(result["text"] in msg["content"] for msg in window):
+                continue
+            snippet = f"- ({result['role']}, conversation {result['conversation_id']}) {result['text']}"
+            cost = estimate_tokens(snippet)
+            if cost > budget:
+                continue
+            budget -= cost
+            snippets.append(snippet)
+        return snippets
+
+    def memory_usage(self) -> int:
+        """
+        Rough size in bytes of the state this engine keeps warm.
+        """
+        return self.history_chars + 64 * len(self.history or [])
+
+    def _resolve_call(self, call: ToolCall, tools: List[Dict[str, Any]]) -> Optional[ToolCall]:
+        """
+        Match a parsed call to an offered tool, filling in the server when the
+        model omitted it. Returns None for tools that were not offered.
+        """
+        for tool in tools:
+            if tool.get("name") == call.tool and call.server in (None, tool.get("server")):
+                return ToolCall(call.tool, tool.get("server"), call.arguments)
+        return None
+
+    def _is_read_only(self, call: ToolCall, tools: List[Dict[str, Any]]) -> bool:
+        resolved = self._resolve_call(call, tools)
+        if not resolved:
+            return False
+        if resolved.tool in settings.READ_ONLY_TOOLS or f"{resolved.server}/{resolved.tool}" in settings.READ_ONLY_TOOLS:
+            return True
+        for tool in tools:
+            if tool.get("name") == resolved.tool and tool.get("server") == resolved.server:
+                annotations = tool.get("annotations") or {}
+                return bool(annotations.get("readOnlyHint"))
+        return False
+
+    async def _run_tool(self, call: ToolCall) -> str:
+        if call.server is None:
+            return f"Error: no server given for tool {call.tool}"
+        try:
+            result = await self.mcp.call_tool(call.server, call.tool, call.arguments, priority=self.tool_priority)
+        except Exception as e:
+            return f"Error: {e}"
+        return format_tool_result(result)
+
+    def _llm_messages(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        # Providers only accept user/assistant turns for the text tool protocol
+        messages = []
+        for msg in history:
+            if msg["role"] == "tool":
+                content = self._turn_results.get(msg["content"], msg["content"])
+                messages.append({"role": "user", "content": content})
+            else:
+                messages.append(msg)
+        return messages
 
-        # Add assistant response to memory
-        await self.memory.add_message(self.conversation_id, "assistant", full_response)
-        
-        # TODO: Parse response for tool calls and execute them (ReAct loop)
-        # For this MVP step, we just return the response.
-        
     async def cleanup(self):
+        if self.semantic:
+            await self.semantic.flush()
         await self.mcp.cleanup()
@@ -12,6 +12,11 @@ class MCPServerConfig(BaseSettings):
     env: Dict[str, str] = {}
     url: Optional[str] = None
     headers: Dict[str, str] = {}
+    # Tool call scheduling
+    max_in_flight: int = 4
+    max_queue: int = 64
+    tool_timeout: Optional[float] = 60.0
+    tool_timeouts: Dict[str, float] = {}
 
 class Settings(BaseSettings):
     # LLM Configuration
@@ -21,15 +26,70 @@ class Settings(BaseSettings):
     LOCAL_MODEL_PATH: str = "models/tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf"
     LOCAL_MODEL_REPO: str = "TheBloke/TinyLlama-1.1B-Chat-v1.0-GGUF"
     LOCAL_MODEL_FILENAME: str = "tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf"
+    # Verified before the downloaded file is put in place (and once for existing files).
+    # When unset, the checksum advertised by the server (Hugging Face X-Linked-Etag) is used.
+    LOCAL_MODEL_SHA256: Optional[str] = None
+    # Shared directory for downloaded models; LOCAL_MODEL_PATH links into it
+    MODEL_CACHE_DIR: Optional[str] = None
+    MODEL_DOWNLOAD_CONNECTIONS: int = 4
+    
+    # Prefill the system prompt once the model is loaded
+    LLM_WARMUP: bool = True
+    # Seconds a chat request waits for the model to finish loading (0 = fail fast)
+    LLM_READY_TIMEOUT: float = 30.0
     
     # Cloud Keys
     OPENAI_API_KEY: Optional[str] = None
     GEMINI_API_KEY: Optional[str] = None
     ANTHROPIC_API_KEY: Optional[str] = None
     
+    # Per-provider request limits (requests per minute), e.g. {"openai": 500}
+    PROVIDER_RPM: Dict[str, int] = {}
+    # Per-provider token limits (tokens per minute), e.g. {"openai": 30000}
+    PROVIDER_TPM: Dict[str, int] = {}
+    
     # MCP Configuration
     MCP_SERVERS: List[MCPServerConfig] = []
     
+    # Tool selection: offer only the top-k relevant tools per turn (0 = all tools)
+    TOOL_SELECTION_TOP_K: int = 8
+    TOOL_SELECTION_PINNED: List[str] = []
+    
+    # Tool execution
+    MAX_TOOL_ROUNDS: int = 3
+    # Start read-only tool calls while the model is still streaming
+    SPECULATIVE_TOOL_DISPATCH: bool = True
+    # Tools treated as read-only in addition to those with a readOnlyHint annotation
+    READ_ONLY_TOOLS: List[str] = []
+    
+    # Large tool results are stored out of band above this size
+    BLOB_STORE_PATH: str = "blobs"
+    BLOB_THRESHOLD_BYTES: int = 16384
+    BLOB_PREVIEW_CHARS: int = 512
+    
+    # Semantic memory: retrieve relevant snippets from past messages instead of replaying the whole history
+    SEMANTIC_MEMORY_ENABLED: bool = False
+    SEMANTIC_MEMORY_PATH: str = "memory_index"
+    # "hash" (built-in, matches shared words only) or a sentence-transformers model name
+    SEMANTIC_MEMORY_EMBEDDER: str = "hash"
+    # Where snippets are recalled from: "all" conversations or only the current "conversation"
+    SEMANTIC_MEMORY_SCOPE: str = "all"
+    SEMANTIC_MEMORY_TOP_K: int = 5
+    SEMANTIC_MEMORY_TOKEN_BUDGET: int = 512
+    SEMANTIC_MEMORY_MIN_SCORE: float = 0.2
+    # Most recent messages of the conversation still sent in full
+    SEMANTIC_MEMORY_RECENT_MESSAGES: int = 8
+    
+    # Warm chat engines kept between turns (server only)
+    ENGINE_POOL_SIZE: int = 128
+    ENGINE_IDLE_TTL: float = 900.0
+    ENGINE_POOL_MAX_BYTES: int = 64 * 1024 * 1024
+    
+    # Message storage compression: "none" or "zstd"
+    MESSAGE_COMPRESSION: str = "none"
+    MESSAGE_COMPRESSION_LEVEL: int = 3
+    MESSAGE_COMPRESSION_MIN_BYTES: int = 256
+    
     # App Config
     DEBUG: bool = False
     
@@ -49,7 +109,11 @@ class Settings(BaseSettings):
                             args=config.get("args", []),
                             env=config.get("env", {}),
                             url=config.get("url"),
-                            headers=config.get("headers", {})
+                            headers=config.get("headers", {}),
+                            max_in_flight=config.get("max_in_flight", 4),
+                            max_queue=config.get("max_queue", 64),
+                            tool_timeout=config.get("tool_timeout", 60.0),
+                            tool_timeouts=config.get("tool_timeouts", {})
                         ))
             except Exception as e:
                 print(f"Error loading mcp.json: {e}")
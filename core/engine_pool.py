@@ -0,0 +1,116 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from core.chat_engine import ChatEngine
+
+
+class _Entry:
+    def __init__(self, engine: ChatEngine):
+        self.engine = engine
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        # Holders plus waiters; entries with users are never evicted
+        self.users = 0
+
+
+class EngineLease:
+    """
+    Exclusive use of a pooled engine. Call `release()` when the turn is done.
+    """
+
+    def __init__(self, pool: "EnginePool", entry: _Entry):
+        self.pool = pool
+        self.entry = entry
+        self.engine = entry.engine
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.entry.last_used = time.monotonic()
+        self.entry.users -= 1
+        self.entry.lock.release()
+        self.pool.evict()
+
+
+class EnginePool:
+    """
+    Bounded LRU of live ChatEngines keyed by conversation id.
+
+    Engines keep their history warm between turns. Turns on the same
+    conversation are serialized by a per-conversation lock. Idle engines are
+    evicted after `idle_ttl` seconds, and least recently used engines are
+    evicted when the pool exceeds `max_engines` or `max_bytes` of warm state.
+    Engines in use are never evicted.
+    """
+
+    def __init__(self, max_engines: int = 128, idle_ttl: float = 900, max_bytes: int = 64 * 1024 * 1024):
+        self.max_engines = max_engines
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def acquire(self, conversation_id: Optional[int], factory: Callable[[Optional[int]], ChatEngine]) -> EngineLease:
+        entry = self._entries.get(conversation_id) if conversation_id is not None else None
+        if entry is None:
+            self.misses += 1
+            engine = factory(conversation_id)
+            await engine.initialize()
+            # initialize() may have created the conversation; another request may have raced us here
+            entry = self._entries.get(engine.conversation_id)
+            if entry is None:
+                entry = _Entry(engine)
+                self._entries[engine.conversation_id] = entry
+        else:
+            self.hits += 1
+
+        self._entries.move_to_end(entry.engine.conversation_id)
+        entry.users += 1
+        try:
+            await entry.lock.acquire()
+        except BaseException:
+            entry.users -= 1
+            raise
+        entry.last_used = time.monotonic()
+        return EngineLease(self, entry)
+
+    def memory_usage(self) -> int:
+        return sum(entry.engine.memory_usage() for entry in self._entries.values())
+
+    def evict(self):
+        now = time.monotonic()
+        for conversation_id, entry in list(self._entries.items()):
+            if not entry.users and now - entry.last_used > self.idle_ttl:
+                del self._entries[conversation_id]
+                self.evictions += 1
+
+        usage = self.memory_usage()
+        # OrderedDict iterates least recently used first
+        for conversation_id, entry in list(self._entries.items()):
+            if len(self._entries) <= self.max_engines and usage <= self.max_bytes:
+                break
+            if entry.users:
+                continue
+            usage -= entry.engine.memory_usage()
+            del self._entries[conversation_id]
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "engines": len(self._entries),
+            "max_engines": self.max_engines,
+            "memory_bytes": self.memory_usage(),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
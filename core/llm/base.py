@@ -15,3 +15,9 @@ class BaseLLM(ABC):
         Stream the response from the LLM.
         """
         pass
+
+    async def warmup(self, system_prompt: Optional[str] = None):
+        """
+        Optionally prepare the model ahead of the first request.
+        """
+        pass
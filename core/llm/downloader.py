@@ -0,0 +1,348 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Set, Tuple
+
+import requests
+from tqdm import tqdm
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CHUNK_SIZE = 16 * 1024 * 1024   # bytes per Range request
+BUFFER_SIZE = 1024 * 1024       # bytes per read from the socket
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ChecksumError(ValueError):
+    pass
+
+
+class ModelDownloader:
+    """
+    Resumable, parallel download of a single large file.
+
+    The file is fetched with concurrent HTTP Range requests into a
+    preallocated `<dest>.part` file. Finished chunks are recorded in a
+    `<dest>.part.json` manifest, so an interrupted download resumes where it
+    stopped. The SHA-256 is verified (when given) before the part file is
+    atomically renamed to `dest`, so `dest` never exists half-written.
+    Servers without Range support fall back to a single streamed request.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        dest: str,
+        sha256: Optional[str] = None,
+        connections: int = 4,
+        chunk_size: int = CHUNK_SIZE,
+        buffer_size: int = BUFFER_SIZE,
+        session: Optional[requests.Session] = None,
+        progress: bool = True,
+    ):
+        self.url = url
+        self.dest = dest
+        self.sha256 = sha256.lower() if sha256 else None
+        self.connections = max(1, connections)
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.session = session or requests.Session()
+        self.progress = progress
+        self.part_path = dest + ".part"
+        self.manifest_path = dest + ".part.json"
+        self._lock = threading.Lock()
+
+    def _probe(self):
+        response = self.session.head(self.url, allow_redirects=True, timeout=30)
+        response.raise_for_status()
+        size = int(response.headers.get("content-length", 0))
+        ranges = response.headers.get("accept-ranges", "").lower() == "bytes"
+        # Range requests go straight to the final location, skipping redirects
+        return response.url, size, ranges
+
+    def _load_manifest(self, size: int) -> Set[int]:
+        if not (os.path.exists(self.manifest_path) and os.path.exists(self.part_path)):
+            return set()
+        try:
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return set()
+        if manifest.get("size") != size or manifest.get("chunk_size") != self.chunk_size:
+            return set()
+        if os.path.getsize(self.part_path) != size:
+            return set()
+        return set(manifest.get("done", []))
+
+    def _save_manifest(self, size: int, done: Set[int]):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"url": self.url, "size": size, "chunk_size": self.chunk_size, "done": sorted(done)}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _preallocate(self, size: int):
+        with open(self.part_path, "wb") as f:
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(f.fileno(), 0, size)
+                    return
+                except OSError:
+                    pass
+            f.truncate(size)
+
+    def _fetch_chunk(self, url: str, index: int, size: int, done: Set[int], bar: Optional[tqdm]):
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, size) - 1
+        response = self.session.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=60)
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise IOError(f"Server ignored Range request for bytes {start}-{end}")
+
+        written = 0
+        with open(self.part_path, "r+b") as f:
+            f.seek(start)
+            for data in response.iter_content(chunk_size=self.buffer_size):
+                f.write(data)
+                written += len(data)
+                if bar:
+                    with self._lock:
+                        bar.update(len(data))
+        if written != end - start + 1:
+            raise IOError(f"Short read for bytes {start}-{end}: got {written}")
+
+        with self._lock:
+            done.add(index)
+            self._save_manifest(size, done)
+
+    def _download_ranges(self, url: str, size: int):
+        done = self._load_manifest(size)
+        if not done:
+            self._preallocate(size)
+            self._save_manifest(size, done)
+
+        n_chunks = (size + self.chunk_size - 1) // self.chunk_size
+        pending: List[int] = [i for i in range(n_chunks) if i not in done]
+        already = sum(min(self.chunk_size, size - i * self.chunk_size) for i in done)
+
+        bar = self._bar(size, already)
+        try:
+            with ThreadPoolExecutor(max_workers=self.connections) as pool:
+                futures = [pool.submit(self._fetch_chunk, url, i, size, done, bar) for i in pending]
+                for future in futures:
+                    future.result()
+        finally:
+            if bar:
+                bar.close()
+
+    def _download_single(self, url: str, size: int):
+        response = self.session.get(url, stream=True, timeout=60)
+        response.raise_for_status()
+        bar = self._bar(size, 0)
+        try:
+            with open(self.part_path, "wb") as f:
+                for data in response.iter_content(chunk_size=self.buffer_size):
+                    f.write(data)
+                    if bar:
+                        bar.update(len(data))
+        finally:
+            if bar:
+                bar.close()
+
+    def _bar(self, size: int, initial: int) -> Optional[tqdm]:
+        if not self.progress:
+            return None
+        return tqdm(
+            desc=os.path.basename(self.dest),
+            total=size or None,
+            initial=initial,
+            unit="iB",
+            unit_scale=True,
+            unit_divisor=1024,
+        )
+
+    def download(self) -> str:
+        dest_dir = os.path.dirname(self.dest)
+        if dest_dir:
+            os.makedirs(dest_dir, exist_ok=True)
+
+        url, size, ranges = self._probe()
+        if ranges and size:
+            self._download_ranges(url, size)
+        else:
+            self._download_single(url, size)
+
+        if size and os.path.getsize(self.part_path) != size:
+            raise IOError(f"Downloaded size {os.path.getsize(self.part_path)} does not match expected {size}")
+
+        if self.sha256:
+            actual = sha256_file(self.part_path)
+            if actual != self.sha256:
+                # Corrupt data cannot be resumed; start over next time
+                os.remove(self.part_path)
+                if os.path.exists(self.manifest_path):
+                    os.remove(self.manifest_path)
+                raise ChecksumError(f"SHA-256 mismatch for {self.url}: expected {self.sha256}, got {actual}")
+            write_verified_marker(self.dest, actual)
+
+        os.replace(self.part_path, self.dest)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        return self.dest
+
+
+def write_verified_marker(path: str, digest: str):
+    with open(path + ".sha256", "w") as f:
+        f.write(digest)
+
+
+def remote_metadata(url: str, session: Optional[requests.Session] = None) -> Tuple[Optional[str], Optional[int]]:
+    """
+    (sha256, size) advertised by the server for `url`, either may be None.
+    Hugging Face returns the SHA-256 of LFS files as `X-Linked-Etag` (and the
+    size as `X-Linked-Size`) on the redirect response.
+    """
+    response = (session or requests).head(url, allow_redirects=True, timeout=30)
+    response.raise_for_status()
+    sha256 = size = None
+    for hop in [*response.history, response]:
+        etag = hop.headers.get("x-linked-etag", "").strip().strip('"').lower()
+        if SHA256_RE.match(etag):
+            sha256 = etag
+        linked_size = hop.headers.get("x-linked-size")
+        if linked_size and linked_size.isdigit():
+            size = int(linked_size)
+    if size is None and response.headers.get("content-length", "").isdigit():
+        size = int(response.headers["content-length"])
+    return sha256, size or None
+
+
+def is_verified(path: str, sha256: Optional[str], size: Optional[int] = None) -> bool:
+    """
+    Whether an existing file can be used. With a checksum, the file is hashed
+    once and the result remembered in a `<path>.sha256` marker. Without one,
+    the size is checked when known.
+    """
+    if not os.path.exists(path):
+        return False
+    if size is not None and os.path.getsize(path) != size:
+        return False
+    if not sha256:
+        return True
+    marker = path + ".sha256"
+    if os.path.exists(marker):
+        with open(marker, "r") as f:
+            if f.read().strip() == sha256.lower():
+                return True
+    if sha256_file(path) == sha256.lower():
+        write_verified_marker(path, sha256.lower())
+        return True
+    return False
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """
+    Exclusive lock on `path` shared by every process (and thread) on the host.
+    A no-op where `fcntl` is unavailable.
+    """
+    lock_dir = os.path.dirname(path)
+    if lock_dir:
+        os.makedirs(lock_dir, exist_ok=True)
+    with open(path, "a") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _link(src: str, dest: str):
+    dest_dir = os.path.dirname(dest)
+    if dest_dir:
+        os.makedirs(dest_dir, exist_ok=True)
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        try:
+            os.symlink(os.path.abspath(src), dest)
+        except OSError:
+            shutil.copyfile(src, dest)
+    if os.path.exists(src + ".sha256"):
+        shutil.copyfile(src + ".sha256", dest + ".sha256")
+
+
+def ensure_model(
+    url: str,
+    dest: str,
+    sha256: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    connections: int = 4,
+    **kwargs
+) -> str:
+    """
+    Make sure a verified copy of the model exists at `dest`.
+
+    With `cache_dir`, the file is downloaded once into the shared cache and
+    linked into `dest`, so several deployments on one host share one copy.
+
+    Without `sha256`, the checksum the server advertises is used (see
+    `remote_metadata`), falling back to the advertised size. A file verified
+    before (it has a `.sha256` marker) is used without asking the server.
+    """
+    size = None
+    if not sha256:
+        if os.path.exists(dest) and os.path.exists(dest + ".sha256"):
+            return dest
+        try:
+            sha256, size = remote_metadata(url, kwargs.get("session"))
+        except requests.RequestException as e:
+            if os.path.exists(dest):
+                print(f"Could not check {dest} against {url} ({e}); using it unverified.")
+                return dest
+            raise
+
+    if is_verified(dest, sha256, size):
+        return dest
+    if os.path.lexists(dest):
+        print(f"Model at {dest} failed verification; downloading again.")
+
+    target = dest
+    if cache_dir:
+        target = os.path.join(cache_dir, sha256.lower() if sha256 else "by-name", os.path.basename(dest))
+
+    # Deployments sharing the cache download the file once; the others wait and reuse it
+    with _file_lock(target + ".lock"):
+        if not is_verified(target, sha256, size):
+            if os.path.lexists(target):
+                os.remove(target)
+            print(f"Model not found at {dest}. Downloading...")
+            ModelDownloader(url, target, sha256=sha256, connections=connections, **kwargs).download()
+            print("Model downloaded successfully.")
+    if target != dest:
+        _link(target, dest)
+    return dest
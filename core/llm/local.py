@@ -1,11 +1,11 @@
+import asyncio
 import os
 import sys
-import requests
 from typing import AsyncGenerator, List, Dict, Optional
-from tqdm import tqdm
 from llama_cpp import Llama
 from core.config import settings
 from core.llm.base import BaseLLM
+from core.llm.downloader import ensure_model
 
 class LocalLLM(BaseLLM):
     def __init__(self):
@@ -19,30 +19,25 @@ class LocalLLM(BaseLLM):
         )
 
     def _ensure_model_exists(self):
-        if os.path.exists(self.model_path):
-            return
-
-        print(f"Model not found at {self.model_path}. Downloading...")
-        os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-        
         url = f"https://huggingface.co/{settings.LOCAL_MODEL_REPO}/resolve/main/{settings.LOCAL_MODEL_FILENAME}"
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        
-        with open(self.model_path, "wb") as f, tqdm(
-            desc=settings.LOCAL_MODEL_FILENAME,
-            total=total_size,
-            unit='iB',
-            unit_scale=True,
-            unit_divisor=1024,
-        ) as bar:
-            for data in response.iter_content(chunk_size=1024):
-                size = f.write(data)
-                bar.update(size)
-        
-        print("Model downloaded successfully.")
+        ensure_model(
+            url,
+            self.model_path,
+            sha256=settings.LOCAL_MODEL_SHA256,
+            cache_dir=settings.MODEL_CACHE_DIR,
+            connections=settings.MODEL_DOWNLOAD_CONNECTIONS
+        )
+
+    async def warmup(self, system_prompt: Optional[str] = None):
+        # Evaluate the system prompt so its prefix is already in the KV cache
+        # when the first real request arrives.
+        if not system_prompt:
+            return
+        await asyncio.to_thread(
+            self.llm.create_chat_completion,
+            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": ""}],
+            max_tokens=1
+        )
 
     async def chat_complete(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None) -> str:
         # Convert messages to llama-cpp format if needed, but it supports OpenAI format mostly
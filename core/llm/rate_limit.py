@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from core.config import settings
+from core.llm.base import BaseLLM
+
+# Rough token estimate used before a request is sent; reconciled afterwards.
+CHARS_PER_TOKEN = 4
+ESTIMATED_OUTPUT_TOKENS = 512
+
+
+class TokenBucket:
+    """
+    Async token bucket. `rate_per_minute` tokens are added continuously up
+    to `capacity`; `acquire()` waits until enough tokens are available.
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float = 1.0) -> float:
+        """
+        Seconds until `amount` tokens would be available.
+        """
+        self._refill()
+        # Requests larger than the bucket only need it to be full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float = 1.0):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """
+        Correct the balance after the fact, e.g. once actual usage is known.
+        A negative balance is debt that delays later requests.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """
+        Take `amount` tokens, waiting if needed. Returns the seconds waited.
+        """
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                wait = self.delay(amount)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.take(amount)
+        return time.monotonic() - start
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class Admission:
+    def __init__(self, estimated_tokens: int, waited: float, queue_depth: int):
+        self.estimated_tokens = estimated_tokens
+        self.waited = waited
+        self.queue_depth = queue_depth
+
+
+class ProviderLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits for one provider, shared
+    by every flow (conversation or API key) that uses it.
+
+    Waiting requests are ordered by (self-clocked) weighted fair queuing: each
+    request gets a virtual finish time of
+    `max(virtual time, flow's last finish) + tokens / weight`, where the
+    virtual time is the finish time of the last admitted request, and the
+    smallest finish time is admitted first whenever both buckets allow.
+    A flow sending a burst therefore queues behind its own earlier requests,
+    not in front of everyone else's.
+    """
+
+    def __init__(self, name: str, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._virtual_time = 0.0
+        self._finish: Dict[str, float] = {}
+        self._queue: List[Tuple[float, int, asyncio.Future, int]] = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, fut, _ in self._queue if not fut.done())
+
+    def _delay(self, tokens: int) -> float:
+        delay = 0.0
+        if self.requests:
+            delay = max(delay, self.requests.delay(1))
+        if self.tokens:
+            delay = max(delay, self.tokens.delay(tokens))
+        return delay
+
+    def _take(self, tokens: int):
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+
+    async def _dispatch(self):
+        while self._queue:
+            finish, _, fut, tokens = self._queue[0]
+            if fut.done():
+                heapq.heappop(self._queue)
+                continue
+            delay = self._delay(tokens)
+            if delay > 0:
+                # Re-check after sleeping; an earlier-finishing request may have arrived.
+                await asyncio.sleep(delay)
+                continue
+            heapq.heappop(self._queue)
+            self._take(tokens)
+            self._virtual_time = finish
+            fut.set_result(None)
+        self._dispatcher = None
+
+    async def acquire(self, flow: str, estimated_tokens: int, weight: float = 1.0) -> Admission:
+        start = time.monotonic()
+        depth = self.queue_depth
+
+        finish = max(self._virtual_time, self._finish.get(flow, 0.0)) + estimated_tokens / max(weight, 1e-6)
+        self._finish[flow] = finish
+
+        if not depth and self._delay(estimated_tokens) <= 0:
+            self._take(estimated_tokens)
+            self._virtual_time = finish
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, (finish, next(self._seq), fut, estimated_tokens))
+            if self._dispatcher is None:
+                self._dispatcher = asyncio.create_task(self._dispatch())
+            await fut
+
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        if len(self._finish) > 10000:
+            # Forget flows that are fully served
+            self._finish = {k: v for k, v in self._finish.items() if v > self._virtual_time}
+        return Admission(estimated_tokens, waited, depth)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        if self.tokens:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "provider": self.name,
+            "rpm": self.requests.capacity if self.requests else None,
+            "tpm": self.tokens.capacity if self.tokens else None,
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+_LIMITERS: Dict[str, ProviderLimiter] = {}
+
+def get_provider_limiter(provider: str) -> ProviderLimiter:
+    """
+    One limiter per provider per process, so limits hold across LLM re-inits.
+    """
+    if provider not in _LIMITERS:
+        _LIMITERS[provider] = ProviderLimiter(
+            provider,
+            rpm=settings.PROVIDER_RPM.get(provider),
+            tpm=settings.PROVIDER_TPM.get(provider)
+        )
+    return _LIMITERS[provider]
+
+
+def flow_key(api_key: Optional[str] = None, conversation_id: Optional[int] = None) -> str:
+    if api_key:
+        # Never keep raw keys around
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return f"conversation:{conversation_id}"
+
+
+class RateLimitedLLM(BaseLLM):
+    """
+    Wraps an LLM so every call is admitted through a ProviderLimiter.
+
+    `for_flow()` returns a view bound to one flow. A view can carry a
+    `prepaid` admission (obtained with `admit()` before a response starts
+    streaming), which its next call uses instead of queuing again.
+    """
+
+    def __init__(
+        self,
+        llm: BaseLLM,
+        limiter: ProviderLimiter,
+        flow: str = "default",
+        weight: float = 1.0,
+        prepaid: Optional[Admission] = None
+    ):
+        self.llm = llm
+        self.limiter = limiter
+        self.flow = flow
+        self.weight = weight
+        self.prepaid = prepaid
+
+    def for_flow(self, flow: str, weight: float = 1.0, prepaid: Optional[Admission] = None) -> "RateLimitedLLM":
+        return RateLimitedLLM(self.llm, self.limiter, flow, weight, prepaid)
+
+    async def admit(self, estimated_tokens: int) -> Admission:
+        return await self.limiter.acquire(self.flow, estimated_tokens, self.weight)
+
+    async def warmup(self, system_prompt: Optional[str] = None):
+        await self.llm.warmup(system_prompt)
+
+    def _estimate(self, messages: List[Dict[str, str]], system_prompt: Optional[str]) -> int:
+        prompt = (system_prompt or "") + "".join(m.get("content", "") for m in messages)
+        return estimate_tokens(prompt) + ESTIMATED_OUTPUT_TOKENS
+
+    async def _admission(self, messages: List[Dict[str, str]], system_prompt: Optional[str]) -> Tuple[Admission, int]:
+        prompt_tokens = self._estimate(messages, system_prompt) - ESTIMATED_OUTPUT_TOKENS
+        if self.prepaid:
+            admission, self.prepaid = self.prepaid, None
+        else:
+            admission = await self.admit(prompt_tokens + ESTIMATED_OUTPUT_TOKENS)
+        return admission, prompt_tokens
+
+    async def chat_complete(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None) -> str:
+        admission, prompt_tokens = await self._admission(messages, system_prompt)
+        output = ""
+        try:
+            output = await self.llm.chat_complete(messages, system_prompt=system_prompt)
+            return output
+        finally:
+            self.limiter.reconcile(admission.estimated_tokens, prompt_tokens + estimate_tokens(output or ""))
+
+    async def chat_stream(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None) -> AsyncGenerator[str, None]:
+        admission, prompt_tokens = await self._admission(messages, system_prompt)
+        output_chars = 0
+        try:
+            async for chunk in self.llm.chat_stream(messages, system_prompt=system_prompt):
+                output_chars += len(chunk)
+                yield chunk
+        finally:
+            self.limiter.reconcile(admission.estimated_tokens, prompt_tokens + output_chars // CHARS_PER_TOKEN)
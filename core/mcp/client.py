@@ -6,10 +6,15 @@ from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from mcp.client.sse import sse_client
 from core.config import settings, MCPServerConfig
+from core.mcp.scheduler import ToolCallScheduler, PRIORITY_INTERACTIVE
+from core.mcp.tool_index import ToolIndex
 
 class MCPClientManager:
     def __init__(self):
         self.sessions: Dict[str, ClientSession] = {}
+        self.schedulers: Dict[str, ToolCallScheduler] = {}
+        self.configs: Dict[str, MCPServerConfig] = {}
+        self.tool_index = ToolIndex()
         self.exit_stack = AsyncExitStack()
 
     async def connect_all(self):
@@ -46,6 +51,12 @@ class MCPClientManager:
             
             await session.initialize()
             self.sessions[config.name] = session
+            self.configs[config.name] = config
+            self.schedulers[config.name] = ToolCallScheduler(
+                config.name,
+                max_in_flight=config.max_in_flight,
+                max_queue=config.max_queue
+            )
             print(f"Connected to MCP server: {config.name}")
             
         except Exception as e:
@@ -64,13 +75,35 @@ class MCPClientManager:
                 print(f"Error listing tools for {name}: {e}")
         return all_tools
 
-    async def call_tool(self, server_name: str, tool_name: str, arguments: Dict[str, Any]) -> Any:
+    def select_tools(self, tools: List[Dict[str, Any]], query: str, k: int, pinned: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return self.tool_index.select(tools, query, k, pinned)
+
+    async def call_tool(
+        self,
+        server_name: str,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        priority: int = PRIORITY_INTERACTIVE,
+        timeout: Optional[float] = None
+    ) -> Any:
         if server_name not in self.sessions:
             raise ValueError(f"Server {server_name} not found")
         
         session = self.sessions[server_name]
-        result = await session.call_tool(tool_name, arguments)
+        if timeout is None:
+            config = self.configs[server_name]
+            timeout = config.tool_timeouts.get(tool_name, config.tool_timeout)
+
+        result = await self.schedulers[server_name].run(
+            lambda: session.call_tool(tool_name, arguments),
+            priority=priority,
+            timeout=timeout
+        )
+        self.tool_index.mark_used(f"{server_name}/{tool_name}")
         return result
 
+    def scheduler_stats(self) -> List[Dict[str, Any]]:
+        return [scheduler.stats() for scheduler in self.schedulers.values()]
+
     async def cleanup(self):
         await self.exit_stack.aclose()
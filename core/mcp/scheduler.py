@@ -0,0 +1,129 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Lower value runs first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a server's call queue is at capacity."""
+
+
+class ToolCallTimeoutError(TimeoutError):
+    """Raised when a tool call exceeds its timeout."""
+
+
+class ToolCallScheduler:
+    """
+    Per-server admission control for MCP tool calls.
+
+    At most `max_in_flight` calls run against the session at once. Further
+    calls wait in a bounded priority queue (FIFO within a priority). A call
+    that exceeds its timeout is cancelled; the MCP session turns the
+    cancellation of a pending request into a `notifications/cancelled`
+    message so the server can stop working on it.
+    """
+
+    def __init__(self, name: str, max_in_flight: int = 4, max_queue: int = 64):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self._in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+        # Metrics
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.admitted = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def _acquire(self, priority: int):
+        if self._in_flight < self.max_in_flight and not self.queued:
+            self._in_flight += 1
+            return
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(f"Tool call queue for server {self.name} is full ({self.max_queue})")
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on.
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                # Hand the slot directly to the next waiter; in_flight is unchanged.
+                fut.set_result(None)
+                return
+        self._in_flight -= 1
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        priority: int = PRIORITY_INTERACTIVE,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        queued_at = time.monotonic()
+        await self._acquire(priority)
+        wait = time.monotonic() - queued_at
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+        try:
+            if timeout:
+                result = await asyncio.wait_for(call(), timeout)
+            else:
+                result = await call()
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise ToolCallTimeoutError(f"Tool call on server {self.name} timed out after {timeout}s") from None
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._release()
+
+        self.completed += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "server": self.name,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
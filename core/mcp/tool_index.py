@@ -0,0 +1,172 @@
+import hashlib
+import itertools
+import json
+import math
+import re
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"[A-Za-z0-9]+")
+CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+# Name tokens are a strong signal, so they are counted more than once.
+NAME_WEIGHT = 3
+
+# Recently used tools remembered as fallbacks for queries that match nothing.
+MAX_RECENT = 32
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for word in TOKEN_RE.findall(CAMEL_RE.sub(" ", text or "")):
+        tokens.append(word.lower())
+    return tokens
+
+
+def tool_key(tool: Dict[str, Any]) -> str:
+    return f"{tool.get('server')}/{tool.get('name')}"
+
+
+def _tool_terms(tool: Dict[str, Any]) -> List[str]:
+    terms = tokenize(tool.get("name", "")) * NAME_WEIGHT
+    terms += tokenize(tool.get("title") or "")
+    terms += tokenize(tool.get("description") or "")
+    schema = tool.get("inputSchema") or {}
+    for param, spec in (schema.get("properties") or {}).items():
+        terms += tokenize(param)
+        if isinstance(spec, dict):
+            terms += tokenize(spec.get("description") or "")
+    return terms
+
+
+def _fingerprint(tool: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(tool, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ToolIndex:
+    """
+    BM25 index over tool names, descriptions and parameter docs.
+
+    `update()` takes the full catalog and only re-indexes tools that were
+    added, removed or changed since the last call. `mark_used()` records
+    tools that were called, which `select()` prefers when filling slots the
+    query does not match.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._fingerprints: Dict[str, str] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_len = 0
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def _add(self, key: str, tool: Dict[str, Any], fingerprint: str):
+        terms = Counter(_tool_terms(tool))
+        self._fingerprints[key] = fingerprint
+        self._doc_terms[key] = terms
+        length = sum(terms.values())
+        self._doc_len[key] = length
+        self._total_len += length
+        for term, tf in terms.items():
+            self._postings[term][key] = tf
+
+    def _remove(self, key: str):
+        terms = self._doc_terms.pop(key)
+        self._fingerprints.pop(key)
+        self._total_len -= self._doc_len.pop(key)
+        for term in terms:
+            posting = self._postings[term]
+            posting.pop(key, None)
+            if not posting:
+                del self._postings[term]
+
+    def mark_used(self, key: str):
+        self._recent[key] = None
+        self._recent.move_to_end(key)
+        while len(self._recent) > MAX_RECENT:
+            self._recent.popitem(last=False)
+
+    def update(self, tools: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        Sync the index with the catalog. Returns (added, removed) counts,
+        where a changed tool counts as both.
+        """
+        current = {}
+        for tool in tools:
+            current[tool_key(tool)] = tool
+
+        added = removed = 0
+        for key in list(self._fingerprints):
+            if key not in current:
+                self._remove(key)
+                removed += 1
+
+        for key, tool in current.items():
+            fingerprint = _fingerprint(tool)
+            existing = self._fingerprints.get(key)
+            if existing == fingerprint:
+                continue
+            if existing is not None:
+                self._remove(key)
+                removed += 1
+            self._add(key, tool, fingerprint)
+            added += 1
+        return added, removed
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        n_docs = len(self._doc_terms)
+        if not n_docs or k <= 0:
+            return []
+        avg_len = self._total_len / n_docs or 1.0
+
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for key, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[key] / avg_len)
+                scores[key] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:k]
+
+    def select(
+        self,
+        tools: List[Dict[str, Any]],
+        query: str,
+        k: int,
+        pinned: Optional[Iterable[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the pinned tools followed by k more: the tools most relevant
+        to `query`, then recently used tools, then the rest in catalog order.
+        Always filling k slots keeps short follow-ups ("yes, do it") working.
+        Pinned entries match either a tool name or `server/name`.
+        """
+        self.update(tools)
+        pinned = set(pinned or [])
+        by_key = {tool_key(tool): tool for tool in tools}
+
+        selected = [
+            tool for key, tool in by_key.items()
+            if key in pinned or tool.get("name") in pinned
+        ]
+        chosen = {tool_key(tool) for tool in selected}
+        ranked = [key for key, _ in self.search(query, k + len(chosen))]
+        recent = [key for key in reversed(self._recent) if key in by_key]
+        target = len(selected) + k
+        for key in itertools.chain(ranked, recent, by_key):
+            if len(selected) >= target:
+                break
+            if key not in chosen:
+                chosen.add(key)
+                selected.append(by_key[key])
+        return selected
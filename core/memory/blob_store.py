@@ -0,0 +1,137 @@
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Tuple
+
+HANDLE_PREFIX = "[blob sha256:"
+HANDLE_RE = re.compile(r"^\[blob sha256:([0-9a-f]{64}) (\d+) bytes\]")
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def format_handle(digest: str, size: int, preview: str) -> str:
+    """
+    Build the compact message content that stands in for a spilled payload.
+    """
+    handle = f"{HANDLE_PREFIX}{digest} {size} bytes]"
+    if preview:
+        handle += f"\n{preview}\n[... truncated, full result stored out of band]"
+    return handle
+
+
+def parse_handle(content: str) -> Optional[Tuple[str, int]]:
+    """
+    Return (digest, size) if `content` is a blob handle, else None.
+    """
+    if not content or not content.startswith(HANDLE_PREFIX):
+        return None
+    match = HANDLE_RE.match(content)
+    if not match:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+class BlobStore:
+    """
+    Content-addressed on-disk store for large payloads.
+
+    Blobs are keyed by their SHA-256 digest and laid out as
+    `<root>/<digest[:2]>/<digest>`, so identical payloads are stored once.
+    Reads memory-map the file instead of copying it into the heap.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        if not DIGEST_RE.match(digest):
+            raise ValueError(f"Invalid blob digest: {digest}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            # Refresh mtime so a concurrent GC treats it as recently referenced.
+            os.utime(path)
+            return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def size(self, digest: str) -> int:
+        return os.path.getsize(self.path(digest))
+
+    @contextmanager
+    def open(self, digest: str) -> Iterator[memoryview]:
+        """
+        Memory-map a blob read-only. The view is only valid inside the block.
+        """
+        path = self.path(digest)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield memoryview(b"")
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+    def read(self, digest: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        with self.open(digest) as view:
+            return bytes(view[start:end])
+
+    def delete(self, digest: str):
+        path = self.path(digest)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def digests(self) -> Iterator[str]:
+        if not os.path.isdir(self.root):
+            return
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if DIGEST_RE.match(name):
+                    yield name
+
+    def gc(self, referenced: Iterable[str], grace_seconds: float = 3600) -> int:
+        """
+        Delete blobs not in `referenced`. Blobs modified within the grace
+        period are kept so a payload written just before its message row is
+        committed is not collected. Returns the number of blobs deleted.
+        """
+        keep = set(referenced)
+        cutoff = time.time() - grace_seconds
+        deleted = 0
+        for digest in list(self.digests()):
+            if digest in keep:
+                continue
+            path = self.path(digest)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                os.remove(path)
+                deleted += 1
+            except FileNotFoundError:
+                continue
+        return deleted
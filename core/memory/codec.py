@@ -0,0 +1,100 @@
+from typing import Dict, List, Optional, Tuple, Union
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+from core.memory.blob_store import HANDLE_PREFIX
+
+# Codec tags stored in messages.codec. NULL means plain text.
+CODEC_ZSTD = "zstd"
+CODEC_ZSTD_DICT = "zstd:"  # followed by the compression_dicts row id
+
+
+class MessageCodec:
+    """
+    Encodes message content for storage and decodes it on read.
+
+    Each row carries its own codec tag, so rows written with an older
+    dictionary, without a dictionary, or uncompressed all stay readable.
+    """
+
+    def __init__(self, enabled: bool = False, level: int = 3, min_bytes: int = 256):
+        if enabled and zstd is None:
+            print("zstandard is not installed; storing messages uncompressed.")
+            enabled = False
+        self.enabled = enabled
+        self.level = level
+        self.min_bytes = min_bytes
+        self.dicts: Dict[int, bytes] = {}
+        self.active_dict_id: Optional[int] = None
+        self._compressors: Dict[Optional[int], "zstd.ZstdCompressor"] = {}
+        self._decompressors: Dict[Optional[int], "zstd.ZstdDecompressor"] = {}
+
+    def add_dict(self, dict_id: int, data: bytes, activate: bool = True):
+        self.dicts[dict_id] = data
+        if activate and (self.active_dict_id is None or dict_id > self.active_dict_id):
+            self.active_dict_id = dict_id
+
+    def active_tag(self) -> Optional[str]:
+        if not self.enabled:
+            return None
+        if self.active_dict_id is not None:
+            return f"{CODEC_ZSTD_DICT}{self.active_dict_id}"
+        return CODEC_ZSTD
+
+    def _dict(self, dict_id: Optional[int]):
+        if dict_id is None:
+            return None
+        if dict_id not in self.dicts:
+            raise KeyError(f"Compression dictionary {dict_id} is not loaded")
+        return zstd.ZstdCompressionDict(self.dicts[dict_id])
+
+    def _compressor(self, dict_id: Optional[int]):
+        if dict_id not in self._compressors:
+            self._compressors[dict_id] = zstd.ZstdCompressor(level=self.level, dict_data=self._dict(dict_id))
+        return self._compressors[dict_id]
+
+    def _decompressor(self, dict_id: Optional[int]):
+        if dict_id not in self._decompressors:
+            self._decompressors[dict_id] = zstd.ZstdDecompressor(dict_data=self._dict(dict_id))
+        return self._decompressors[dict_id]
+
+    def encode(self, content: str) -> Tuple[Union[str, bytes], Optional[str]]:
+        """
+        Return (stored value, codec tag) for `content`.
+        """
+        # Blob handles stay plain text so gc_blobs can find them with LIKE.
+        if not self.enabled or content.startswith(HANDLE_PREFIX):
+            return content, None
+        data = content.encode("utf-8")
+        if len(data) < self.min_bytes:
+            return content, None
+        compressed = self._compressor(self.active_dict_id).compress(data)
+        if len(compressed) >= len(data):
+            return content, None
+        return compressed, self.active_tag()
+
+    def decode(self, value: Union[str, bytes], codec: Optional[str]) -> str:
+        if not codec:
+            return value
+        if zstd is None:
+            raise RuntimeError("zstandard is required to read compressed messages")
+        if codec == CODEC_ZSTD:
+            dict_id = None
+        elif codec.startswith(CODEC_ZSTD_DICT):
+            dict_id = int(codec[len(CODEC_ZSTD_DICT):])
+        else:
+            raise ValueError(f"Unknown message codec: {codec}")
+        return self._decompressor(dict_id).decompress(value).decode("utf-8")
+
+
+def train_dictionary(samples: List[str], dict_size: int) -> bytes:
+    if zstd is None:
+        raise RuntimeError("zstandard is required to train a compression dictionary")
+    encoded = [sample.encode("utf-8") for sample in samples if sample]
+    try:
+        return zstd.train_dictionary(dict_size, encoded).as_bytes()
+    except zstd.ZstdError as e:
+        raise ValueError(f"Not enough message data to train a dictionary: {e}")
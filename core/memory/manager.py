@@ -1,17 +1,43 @@
 import aiosqlite
+import asyncio
+import gzip
 import json
 import os
-from typing import List, Dict, Any, Optional
+from typing import AsyncGenerator, AsyncIterable, Iterable, List, Dict, Any, Optional, Union
 from datetime import datetime
+from core.config import settings
+from core.memory.blob_store import BlobStore, format_handle, parse_handle, HANDLE_PREFIX
+from core.memory.codec import MessageCodec, train_dictionary
+from core.memory.vector_index import INDEXED_ROLES, VectorIndex, get_vector_index
 
 DB_PATH = "history.db"
 
+# Roles whose oversized content is moved to the blob store.
+SPILL_ROLES = ("tool",)
+
+# Trained dictionaries never change once written, so they are shared per database.
+_DICT_CACHE: Dict[str, Dict[int, bytes]] = {}
+
+# Databases whose schema has been set up by this process
+_READY_DBS = set()
+
 class MemoryManager:
-    def __init__(self, db_path: str = DB_PATH):
+    def __init__(self, db_path: str = DB_PATH, blob_path: Optional[str] = None, compression: Optional[str] = None):
         self.db_path = db_path
+        self.blobs = BlobStore(blob_path or settings.BLOB_STORE_PATH)
+        self.codec = MessageCodec(
+            enabled=(compression or settings.MESSAGE_COMPRESSION) == "zstd",
+            level=settings.MESSAGE_COMPRESSION_LEVEL,
+            min_bytes=settings.MESSAGE_COMPRESSION_MIN_BYTES
+        )
+        self._codec_loaded = False
 
     async def init_db(self):
         async with aiosqlite.connect(self.db_path) as db:
+            # auto_vacuum only takes effect on a new database (before the first table).
+            await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            # WAL lets readers keep going while archival or imports write.
+            await db.execute("PRAGMA journal_mode = WAL")
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS conversations (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -26,11 +52,37 @@ class MemoryManager:
                     role TEXT,
                     content TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    codec TEXT,
                     FOREIGN KEY(conversation_id) REFERENCES conversations(id)
                 )
             """)
+            async with db.execute("PRAGMA table_info(messages)") as cursor:
+                columns = [row[1] for row in await cursor.fetchall()]
+            if "codec" not in columns:
+                # Databases created before compression support
+                await db.execute("ALTER TABLE messages ADD COLUMN codec TEXT")
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS compression_dicts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    data BLOB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id)"
+            )
             await db.commit()
 
+    async def ensure_db(self):
+        """
+        Run `init_db` once per database per process.
+        """
+        path = os.path.abspath(self.db_path)
+        if path in _READY_DBS:
+            return
+        await self.init_db()
+        _READY_DBS.add(path)
+
     async def create_conversation(self, title: str = "New Chat") -> int:
         async with aiosqlite.connect(self.db_path) as db:
             cursor = await db.execute(
@@ -39,23 +91,103 @@ class MemoryManager:
             await db.commit()
             return cursor.lastrowid
 
-    async def add_message(self, conversation_id: int, role: str, content: str):
+    def _spill(self, role: str, content: str) -> str:
+        if role not in SPILL_ROLES:
+            return content
+        data = content.encode("utf-8")
+        if len(data) <= settings.BLOB_THRESHOLD_BYTES:
+            return content
+        digest = self.blobs.put(data)
+        return format_handle(digest, len(data), content[:settings.BLOB_PREVIEW_CHARS])
+
+    async def _load_codec(self, db: aiosqlite.Connection):
+        if self._codec_loaded:
+            return
+        cache = _DICT_CACHE.setdefault(self.db_path, {})
+        async with db.execute("SELECT id FROM compression_dicts ORDER BY id ASC") as cursor:
+            dict_ids = [row[0] for row in await cursor.fetchall()]
+        for dict_id in dict_ids:
+            if dict_id not in cache:
+                async with db.execute("SELECT data FROM compression_dicts WHERE id = ?", (dict_id,)) as cursor:
+                    cache[dict_id] = (await cursor.fetchone())[0]
+            self.codec.add_dict(dict_id, cache[dict_id])
+        self._codec_loaded = True
+
+    async def _decode(self, db: aiosqlite.Connection, value, codec: Optional[str]) -> str:
+        try:
+            return self.codec.decode(value, codec)
+        except KeyError:
+            # Dictionary trained by another process after we loaded ours
+            self._codec_loaded = False
+            await self._load_codec(db)
+            return self.codec.decode(value, codec)
+
+    async def add_message(self, conversation_id: int, role: str, content: str) -> str:
+        """
+        Store a message. Returns the content as stored (a blob handle for spilled results).
+        """
+        if role in SPILL_ROLES:
+            # Hashing and writing a large payload stays off the event loop
+            content = await asyncio.to_thread(self._spill, role, content)
         async with aiosqlite.connect(self.db_path) as db:
+            await self._load_codec(db)
+            value, codec = self.codec.encode(content)
             await db.execute(
-                "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
-                (conversation_id, role, content)
+                "INSERT INTO messages (conversation_id, role, content, codec) VALUES (?, ?, ?, ?)",
+                (conversation_id, role, value, codec)
             )
             await db.commit()
+        return content
 
     async def get_messages(self, conversation_id: int) -> List[Dict[str, str]]:
         async with aiosqlite.connect(self.db_path) as db:
             db.row_factory = aiosqlite.Row
+            await self._load_codec(db)
             async with db.execute(
-                "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY id ASC",
+                "SELECT role, content, codec FROM messages WHERE conversation_id = ? ORDER BY id ASC",
                 (conversation_id,)
             ) as cursor:
                 rows = await cursor.fetchall()
-                return [{"role": row["role"], "content": row["content"]} for row in rows]
+            return [
+                {"role": row["role"], "content": await self._decode(db, row["content"], row["codec"])}
+                for row in rows
+            ]
+
+    def load_blob(self, digest: str) -> str:
+        return self.blobs.read(digest).decode("utf-8")
+
+    def resolve_content(self, content: str, role: Optional[str] = None) -> str:
+        """
+        Return the full payload for a blob handle, or the content unchanged.
+        With `role`, only roles in SPILL_ROLES are resolved (other messages
+        may merely look like handles), and a missing blob falls back to the
+        stored preview.
+        """
+        handle = parse_handle(content)
+        if handle is None:
+            return content
+        if role is None:
+            return self.load_blob(handle[0])
+        if role not in SPILL_ROLES:
+            return content
+        try:
+            return self.load_blob(handle[0])
+        except FileNotFoundError:
+            print(f"Blob {handle[0]} is missing; keeping the stored preview.")
+            return content
+
+    async def gc_blobs(self, grace_seconds: float = 3600) -> int:
+        referenced = set()
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute(
+                f"SELECT content FROM messages WHERE content LIKE ? AND role IN ({','.join('?' * len(SPILL_ROLES))})",
+                (HANDLE_PREFIX + "%", *SPILL_ROLES)
+            ) as cursor:
+                async for (content,) in cursor:
+                    handle = parse_handle(content)
+                    if handle:
+                        referenced.add(handle[0])
+        return self.blobs.gc(referenced, grace_seconds=grace_seconds)
 
     async def list_conversations(self) -> List[Dict[str, Any]]:
         async with aiosqlite.connect(self.db_path) as db:
@@ -71,3 +203,318 @@ class MemoryManager:
             await db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
             await db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
             await db.commit()
+        await self._forget_indexed([conversation_id])
+
+    def _semantic_index(self) -> Optional[VectorIndex]:
+        if not settings.SEMANTIC_MEMORY_ENABLED:
+            return None
+        return get_vector_index(settings.SEMANTIC_MEMORY_PATH)
+
+    async def _forget_indexed(self, conversation_ids: List[int]):
+        index = self._semantic_index()
+        if index:
+            await index.forget(conversation_ids)
+
+    async def index_conversations(
+        self,
+        conversation_ids: Optional[List[int]] = None,
+        index: Optional[VectorIndex] = None,
+        batch_size: int = 256
+    ) -> int:
+        """
+        Add the user and assistant messages of these conversations (default:
+        all) to the semantic index (default: the configured one, if enabled).
+        Returns the number of chunks added.
+        """
+        index = index or self._semantic_index()
+        if index is None:
+            return 0
+        chunks = 0
+        pending = []
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            if conversation_ids is None:
+                conversation_ids = await self._conversation_ids(db)
+            async for record in self._conversation_records(db, conversation_ids):
+                pending.extend(
+                    (record["id"], msg["role"], msg["content"])
+                    for msg in record["messages"] if msg["role"] in INDEXED_ROLES
+                )
+                if len(pending) >= batch_size:
+                    chunks += await index.index(pending)
+                    pending = []
+        if pending:
+            chunks += await index.index(pending)
+        return chunks
+
+    async def _conversation_records(
+        self,
+        db: aiosqlite.Connection,
+        conversation_ids: List[int],
+        max_message_id: Optional[int] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        await self._load_codec(db)
+        for conversation_id in conversation_ids:
+            async with db.execute(
+                "SELECT id, title, created_at FROM conversations WHERE id = ?", (conversation_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                continue
+            record = {"id": row["id"], "title": row["title"], "created_at": row["created_at"], "messages": []}
+            query = "SELECT role, content, codec, created_at FROM messages WHERE conversation_id = ?"
+            params = (conversation_id,)
+            if max_message_id is not None:
+                query += " AND id <= ?"
+                params += (max_message_id,)
+            async with db.execute(query + " ORDER BY id ASC", params) as cursor:
+                async for msg in cursor:
+                    record["messages"].append({
+                        "role": msg["role"],
+                        # Inline spilled payloads so exports are self-contained
+                        "content": self.resolve_content(await self._decode(db, msg["content"], msg["codec"]), msg["role"]),
+                        "created_at": msg["created_at"]
+                    })
+            yield record
+
+    async def _conversation_ids(self, db: aiosqlite.Connection, before: Optional[str] = None) -> List[int]:
+        if before:
+            query = "SELECT id FROM conversations WHERE created_at < ? ORDER BY id ASC"
+            params = (before,)
+        else:
+            query = "SELECT id FROM conversations ORDER BY id ASC"
+            params = ()
+        async with db.execute(query, params) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def export_conversations(
+        self,
+        conversation_ids: Optional[List[int]] = None,
+        before: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Stream conversations as NDJSON, one conversation (with its messages) per line.
+        """
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            if conversation_ids is None:
+                conversation_ids = await self._conversation_ids(db, before)
+            async for record in self._conversation_records(db, conversation_ids):
+                yield json.dumps(record) + "\n"
+
+    async def import_conversations(
+        self,
+        lines: Union[Iterable[str], AsyncIterable[str]],
+        batch_size: int = 500
+    ) -> int:
+        """
+        Import NDJSON produced by `export_conversations`. Conversations get new
+        ids. Messages are inserted with batched `executemany` and the whole
+        import is committed as a single transaction, then added to the
+        semantic index if enabled. Returns the number of conversations
+        imported.
+        """
+        async def _lines():
+            if hasattr(lines, "__aiter__"):
+                async for line in lines:
+                    yield line
+            else:
+                for line in lines:
+                    yield line
+
+        imported_ids = []
+        pending = []
+        async with aiosqlite.connect(self.db_path) as db:
+            await self._load_codec(db)
+            try:
+                async for line in _lines():
+                    if isinstance(line, bytes):
+                        line = line.decode("utf-8")
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    cursor = await db.execute(
+                        "INSERT INTO conversations (title, created_at) VALUES (?, COALESCE(?, CURRENT_TIMESTAMP))",
+                        (record.get("title", "Imported Chat"), record.get("created_at"))
+                    )
+                    conversation_id = cursor.lastrowid
+                    for msg in record.get("messages", []):
+                        content = msg["content"]
+                        if msg["role"] in SPILL_ROLES:
+                            content = await asyncio.to_thread(self._spill, msg["role"], content)
+                        value, codec = self.codec.encode(content)
+                        pending.append((
+                            conversation_id,
+                            msg["role"],
+                            value,
+                            msg.get("created_at"),
+                            codec
+                        ))
+                    if len(pending) >= batch_size:
+                        await self._insert_messages(db, pending)
+                        pending = []
+                    imported_ids.append(conversation_id)
+                if pending:
+                    await self._insert_messages(db, pending)
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+        await self.index_conversations(imported_ids)
+        return len(imported_ids)
+
+    async def _insert_messages(self, db: aiosqlite.Connection, rows: List[tuple]):
+        await db.executemany(
+            "INSERT INTO messages (conversation_id, role, content, created_at, codec) VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)",
+            rows
+        )
+
+    async def archive_conversations(self, older_than_days: int, archive_path: str, batch_size: int = 50) -> int:
+        """
+        Move conversations with no activity (newest message, or creation if
+        empty) in the last `older_than_days` days into a gzip-compressed
+        NDJSON archive, then reclaim the freed pages.
+
+        Work is done in small batches, each in its own short transaction, so
+        live requests are never locked out for long. A batch is deleted only
+        after it has been flushed and synced to the archive file. Returns the
+        number of conversations archived.
+        """
+        archived = 0
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute(
+                """
+                SELECT c.id FROM conversations c
+                LEFT JOIN messages m ON m.conversation_id = c.id
+                GROUP BY c.id
+                HAVING COALESCE(MAX(m.created_at), c.created_at) < datetime('now', ?)
+                ORDER BY c.id ASC
+                """,
+                (f"-{int(older_than_days)} days",)
+            ) as cursor:
+                conversation_ids = [row[0] for row in await cursor.fetchall()]
+
+            if not conversation_ids:
+                return 0
+
+            archive_dir = os.path.dirname(archive_path)
+            if archive_dir:
+                os.makedirs(archive_dir, exist_ok=True)
+
+            # Append mode adds a new gzip member; readers see one continuous stream.
+            with gzip.open(archive_path, "at", encoding="utf-8") as archive:
+                for start in range(0, len(conversation_ids), batch_size):
+                    batch = conversation_ids[start:start + batch_size]
+                    # Messages added after this point are not archived, so they must not be deleted either
+                    async with db.execute("SELECT COALESCE(MAX(id), 0) FROM messages") as cursor:
+                        max_message_id = (await cursor.fetchone())[0]
+                    async for record in self._conversation_records(db, batch, max_message_id):
+                        archive.write(json.dumps(record) + "\n")
+                    archive.flush()
+                    os.fsync(archive.buffer.fileobj.fileno())
+
+                    placeholders = ",".join("?" * len(batch))
+                    await db.execute(
+                        f"DELETE FROM messages WHERE conversation_id IN ({placeholders}) AND id <= ?",
+                        (*batch, max_message_id)
+                    )
+                    # A conversation that became active meanwhile keeps its new messages
+                    async with db.execute(
+                        f"""
+                        SELECT id FROM conversations WHERE id IN ({placeholders})
+                        AND NOT EXISTS (SELECT 1 FROM messages WHERE conversation_id = conversations.id)
+                        """,
+                        batch
+                    ) as cursor:
+                        removed = [row[0] for row in await cursor.fetchall()]
+                    if removed:
+                        await db.execute(
+                            f"DELETE FROM conversations WHERE id IN ({','.join('?' * len(removed))})", removed
+                        )
+                    await db.commit()
+                    await self._forget_indexed(removed)
+                    archived += len(removed)
+                    # Yield to other tasks between batches
+                    await asyncio.sleep(0)
+
+            await self._incremental_vacuum(db)
+        return archived
+
+    async def _incremental_vacuum(self, db: aiosqlite.Connection, pages_per_step: int = 256):
+        async with db.execute("PRAGMA auto_vacuum") as cursor:
+            mode = (await cursor.fetchone())[0]
+        if mode != 2:
+            # Freed pages are still reused for new rows, but the file will not shrink.
+            print("history.db was not created with auto_vacuum=INCREMENTAL; run VACUUM once to reclaim space.")
+            return
+
+        previous = None
+        while True:
+            async with db.execute("PRAGMA freelist_count") as cursor:
+                free_pages = (await cursor.fetchone())[0]
+            if not free_pages or free_pages == previous:
+                break
+            previous = free_pages
+            async with db.execute(f"PRAGMA incremental_vacuum({pages_per_step})") as cursor:
+                await cursor.fetchall()
+            await db.commit()
+            await asyncio.sleep(0)
+
+    async def train_compression_dict(self, sample_limit: int = 5000, dict_size: int = 112640) -> int:
+        """
+        Train a zstd dictionary on the most recent messages and make it the
+        active dictionary for new writes. Returns the dictionary id.
+        """
+        async with aiosqlite.connect(self.db_path) as db:
+            await self._load_codec(db)
+            samples = []
+            async with db.execute(
+                "SELECT content, codec FROM messages ORDER BY id DESC LIMIT ?", (sample_limit,)
+            ) as cursor:
+                async for content, codec in cursor:
+                    samples.append(await self._decode(db, content, codec))
+
+            data = await asyncio.to_thread(train_dictionary, samples, dict_size)
+            cursor = await db.execute("INSERT INTO compression_dicts (data) VALUES (?)", (data,))
+            await db.commit()
+            dict_id = cursor.lastrowid
+
+        _DICT_CACHE.setdefault(self.db_path, {})[dict_id] = data
+        self.codec.add_dict(dict_id, data)
+        return dict_id
+
+    async def recompress_messages(self, batch_size: int = 500) -> int:
+        """
+        Rewrite rows whose codec differs from the active one (e.g. plain rows
+        or rows using an older dictionary). Each batch is its own short
+        transaction. Returns the number of rows rewritten.
+        """
+        if not self.codec.enabled:
+            return 0
+        rewritten = 0
+        last_id = 0
+        async with aiosqlite.connect(self.db_path) as db:
+            await self._load_codec(db)
+            target = self.codec.active_tag()
+            while True:
+                async with db.execute(
+                    "SELECT id, content, codec FROM messages WHERE id > ? AND codec IS NOT ? ORDER BY id ASC LIMIT ?",
+                    (last_id, target, batch_size)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                updates = []
+                for message_id, content, codec in rows:
+                    value, new_codec = self.codec.encode(await self._decode(db, content, codec))
+                    if new_codec != codec:
+                        updates.append((value, new_codec, message_id))
+                if updates:
+                    await db.executemany("UPDATE messages SET content = ?, codec = ? WHERE id = ?", updates)
+                    await db.commit()
+                    rewritten += len(updates)
+                await asyncio.sleep(0)
+        return rewritten
@@ -0,0 +1,382 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from core.config import settings
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Only conversational turns are indexed; tool output is noisy and often huge.
+INDEXED_ROLES = ("user", "assistant")
+CHUNK_CHARS = 800
+BATCH_SIZE = 64
+MAX_PENDING = 10000
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS) -> List[str]:
+    """
+    Split text into chunks of at most about `size` characters, on whitespace.
+    """
+    text = text.strip()
+    chunks = []
+    while len(text) > size:
+        cut = text.rfind(" ", 0, size)
+        if cut <= 0:
+            cut = size
+        chunks.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+class HashingEmbedder:
+    """
+    Dependency-free local embedder: signed feature hashing of words and word
+    bigrams with sublinear term frequency, L2-normalized.
+
+    Any object with `name`, `dim` and `embed(texts) -> float32 array of shape
+    (len(texts), dim)` can be used instead, e.g. a sentence-transformers model.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hash-{dim}"
+
+    def _features(self, text: str) -> Dict[int, float]:
+        words = TOKEN_RE.findall(text.lower())
+        terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        counts: Dict[int, float] = {}
+        for term in terms:
+            h = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+            index = h % self.dim
+            sign = 1.0 if (h >> 63) & 1 else -1.0
+            counts[index] = counts.get(index, 0.0) + sign
+        return counts
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for index, count in self._features(text).items():
+                vectors[row, index] = math.copysign(1.0 + math.log(abs(count)), count) if count else 0.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SentenceTransformerEmbedder:
+    """
+    Embeds with a sentence-transformers model (optional dependency), so
+    paraphrases match even without shared words.
+    """
+
+    def __init__(self, model_name: str):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError(f"sentence-transformers is required for SEMANTIC_MEMORY_EMBEDDER={model_name}")
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = "st-" + re.sub(r"[^A-Za-z0-9_.-]+", "-", model_name)
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        return np.asarray(self.model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+
+def create_embedder(name: str) -> Any:
+    """
+    "hash" for the built-in HashingEmbedder, otherwise a sentence-transformers model name.
+    """
+    if name == "hash":
+        return HashingEmbedder()
+    return SentenceTransformerEmbedder(name)
+
+
+class VectorIndex:
+    """
+    Local semantic index over message chunks.
+
+    Vectors are stored as one contiguous float32 array in `vectors.f32`
+    (row i is chunk i) and memory-mapped for search, which is a single
+    matrix-vector product plus `argpartition` for the top k. Chunk text and
+    metadata live in a SQLite table next to it. Each embedder gets its own
+    directory under `path`, so switching embedders starts a fresh index.
+
+    `add()` only queues text. A background task embeds queued chunks in
+    batches off the event loop and appends them, so indexing never delays a
+    response.
+    """
+
+    def __init__(self, path: str, embedder: Optional[Any] = None, batch_size: int = BATCH_SIZE):
+        if np is None:
+            raise RuntimeError("numpy is required for semantic memory")
+        self.embedder = embedder or HashingEmbedder()
+        self.root = os.path.join(path, self.embedder.name)
+        self.vectors_path = os.path.join(self.root, "vectors.f32")
+        self.db_path = os.path.join(self.root, "chunks.db")
+        self.batch_size = batch_size
+        self.count = 0
+        self._matrix: Optional["np.ndarray"] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+        self._ready_lock = asyncio.Lock()
+        self._ready = False
+
+    @property
+    def row_bytes(self) -> int:
+        return self.embedder.dim * 4
+
+    async def ensure_ready(self):
+        if self._ready:
+            return
+        # Searches and the indexing task may both get here first; recovery must run once
+        async with self._ready_lock:
+            if not self._ready:
+                await self._recover()
+
+    async def _recover(self):
+        os.makedirs(self.root, exist_ok=True)
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("PRAGMA journal_mode = WAL")
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    row INTEGER PRIMARY KEY,
+                    conversation_id INTEGER,
+                    role TEXT,
+                    text TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            await db.commit()
+            async with db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM chunks") as cursor:
+                (rows,) = await cursor.fetchone()
+
+        # Vectors are appended before their metadata is committed; drop any
+        # rows a crash left without metadata (and metadata without vectors).
+        stored = os.path.getsize(self.vectors_path) // self.row_bytes if os.path.exists(self.vectors_path) else 0
+        self.count = min(rows, stored)
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(self.count * self.row_bytes)
+        if rows > self.count:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute("DELETE FROM chunks WHERE row >= ?", (self.count,))
+                await db.commit()
+        self._ready = True
+
+    def add(self, conversation_id: int, role: str, text: str):
+        """
+        Queue a message for indexing. Never blocks; drops the message if the
+        backlog is full.
+        """
+        if role not in INDEXED_ROLES or not text or not text.strip():
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=MAX_PENDING)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        try:
+            self._queue.put_nowait((conversation_id, role, text))
+        except asyncio.QueueFull:
+            print("Semantic memory backlog is full; message not indexed.")
+
+    async def _run(self):
+        while True:
+            items = [await self._queue.get()]
+            while len(items) < self.batch_size and not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            try:
+                await self.index(items)
+            except Exception as e:
+                print(f"Failed to index {len(items)} messages: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    async def index(self, messages: List[Tuple[int, str, str]]) -> int:
+        """
+        Embed and store `(conversation_id, role, text)` messages. Returns the
+        number of chunks added.
+        """
+        await self.ensure_ready()
+        chunks = [
+            (conversation_id, role, chunk)
+            for conversation_id, role, text in messages
+            for chunk in chunk_text(text)
+        ]
+        if not chunks:
+            return 0
+        vectors = await asyncio.to_thread(self._embed, [chunk for _, _, chunk in chunks])
+
+        async with self._write_lock:
+            start = self.count
+            await asyncio.to_thread(self._append, vectors)
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.executemany(
+                    "INSERT INTO chunks (row, conversation_id, role, text) VALUES (?, ?, ?, ?)",
+                    [(start + i, conversation_id, role, chunk) for i, (conversation_id, role, chunk) in enumerate(chunks)]
+                )
+                await db.commit()
+            self.count = start + len(chunks)
+        return len(chunks)
+
+    def _embed(self, texts: List[str]) -> "np.ndarray":
+        vectors = np.asarray(self.embedder.embed(texts), dtype=np.float32)
+        if vectors.shape != (len(texts), self.embedder.dim):
+            raise ValueError(f"Embedder returned shape {vectors.shape}, expected {(len(texts), self.embedder.dim)}")
+        return vectors
+
+    def _append(self, vectors: "np.ndarray"):
+        with open(self.vectors_path, "r+b") as f:
+            f.seek(self.count * self.row_bytes)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _matrix_view(self, count: int) -> "np.ndarray":
+        if self._matrix is None or self._matrix.shape[0] != count:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, self.embedder.dim))
+        return self._matrix
+
+    def _top_rows(
+        self, query: "np.ndarray", count: int, n: int, among: Optional["np.ndarray"] = None
+    ) -> List[Tuple[int, float]]:
+        matrix = self._matrix_view(count)
+        if among is None:
+            among = np.arange(count)
+            scores = matrix @ query
+        else:
+            scores = matrix[among] @ query
+        n = min(n, len(among))
+        if not n:
+            return []
+        if n < len(among):
+            top = np.argpartition(-scores, n - 1)[:n]
+        else:
+            top = np.arange(len(among))
+        top = top[np.argsort(-scores[top])]
+        return [(int(among[i]), float(scores[i])) for i in top]
+
+    async def _rows_for(self, conversation_ids: List[int], count: int) -> "np.ndarray":
+        if not conversation_ids:
+            return np.zeros(0, dtype=np.int64)
+        async with aiosqlite.connect(self.db_path) as db:
+            placeholders = ",".join("?" * len(conversation_ids))
+            async with db.execute(
+                f"SELECT row FROM chunks WHERE conversation_id IN ({placeholders}) AND row < ? ORDER BY row",
+                [*conversation_ids, count]
+            ) as cursor:
+                return np.array([row for (row,) in await cursor.fetchall()], dtype=np.int64)
+
+    async def search(
+        self,
+        query: str,
+        k: int = 5,
+        min_score: float = 0.0,
+        conversation_ids: Optional[List[int]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        The `k` chunks most similar to `query`, best first, each with
+        `conversation_id`, `role`, `text` and cosine `score`. With
+        `conversation_ids`, only chunks from those conversations are searched.
+        """
+        await self.ensure_ready()
+        count = self.count
+        if not count or k <= 0:
+            return []
+        vector = (await asyncio.to_thread(self._embed, [query]))[0]
+        if not vector.any():
+            return []
+        among = None if conversation_ids is None else await self._rows_for(conversation_ids, count)
+        # Fetch extra candidates in case some chunks were forgotten
+        candidates = await asyncio.to_thread(self._top_rows, vector, count, k * 2, among)
+        candidates = [(row, score) for row, score in candidates if score >= min_score]
+        if not candidates:
+            return []
+
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            placeholders = ",".join("?" * len(candidates))
+            async with db.execute(
+                f"SELECT row, conversation_id, role, text, created_at FROM chunks WHERE row IN ({placeholders})",
+                [row for row, _ in candidates]
+            ) as cursor:
+                found = {r["row"]: dict(r) for r in await cursor.fetchall()}
+
+        results = []
+        for row, score in candidates:
+            if row in found:
+                found[row]["score"] = round(score, 4)
+                results.append(found[row])
+        return results[:k]
+
+    async def forget(self, conversation_ids: List[int]) -> int:
+        """
+        Stop returning chunks from these conversations. Their vectors stay in
+        the file until the index is rebuilt.
+        """
+        await self.ensure_ready()
+        if not conversation_ids:
+            return 0
+        async with aiosqlite.connect(self.db_path) as db:
+            placeholders = ",".join("?" * len(conversation_ids))
+            cursor = await db.execute(f"DELETE FROM chunks WHERE conversation_id IN ({placeholders})", list(conversation_ids))
+            await db.commit()
+            return cursor.rowcount
+
+    async def clear(self):
+        """
+        Delete every chunk and vector, e.g. before rebuilding the index.
+        """
+        await self.flush()
+        async with self._write_lock:
+            for path in (self.vectors_path, self.db_path, self.db_path + "-wal", self.db_path + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._matrix = None
+            self.count = 0
+            self._ready = False
+
+    async def flush(self):
+        """
+        Wait until everything queued so far is indexed.
+        """
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        await self.flush()
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "embedder": self.embedder.name,
+            "chunks": self.count,
+            "pending": self._queue.qsize() if self._queue else 0,
+            "vector_bytes": self.count * self.row_bytes,
+        }
+
+
+_INDEXES: Dict[Tuple[str, str], VectorIndex] = {}
+
+def get_vector_index(path: str, embedder: Optional[str] = None) -> VectorIndex:
+    """
+    One index per path and embedder (default: SEMANTIC_MEMORY_EMBEDDER) per
+    process, so every engine shares one writer.
+    """
+    key = (os.path.abspath(path), embedder or settings.SEMANTIC_MEMORY_EMBEDDER)
+    if key not in _INDEXES:
+        _INDEXES[key] = VectorIndex(key[0], embedder=create_embedder(key[1]))
+    return _INDEXES[key]
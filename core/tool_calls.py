@@ -0,0 +1,123 @@
+import json
+from typing import Any, Dict, List, Optional
+
+
+class ToolCall:
+    def __init__(self, tool: str, server: Optional[str], arguments: Dict[str, Any]):
+        self.tool = tool
+        self.server = server
+        self.arguments = arguments
+
+    @property
+    def key(self) -> str:
+        """
+        Identity used to match a speculative call with the confirmed one.
+        """
+        return json.dumps([self.server, self.tool, self.arguments], sort_keys=True, default=str)
+
+    def __repr__(self) -> str:
+        return f"ToolCall({self.server}/{self.tool}, {self.arguments})"
+
+
+def _to_tool_call(obj: Any) -> Optional[ToolCall]:
+    if not isinstance(obj, dict) or not isinstance(obj.get("tool"), str):
+        return None
+    arguments = obj.get("arguments") or {}
+    if not isinstance(arguments, dict):
+        return None
+    server = obj.get("server")
+    return ToolCall(obj["tool"], server if isinstance(server, str) else None, arguments)
+
+
+class ToolCallParser:
+    """
+    Incremental scanner for the JSON tool-call protocol used in the system
+    prompt (`{"tool": ..., "server": ..., "arguments": {...}}`, usually in a
+    ```json fence). Feed it streamed chunks; it returns each invocation as
+    soon as its closing brace arrives.
+
+    An object only starts at a `{` followed by a `"`, so stray braces in
+    prose do not swallow the rest of the response.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.start: Optional[int] = None
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, chunk: str) -> List[ToolCall]:
+        self.buffer += chunk
+        calls = []
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+
+            if self.start is None:
+                if char == "{":
+                    lookahead = self.buffer[self.pos + 1:].lstrip()
+                    if not lookahead:
+                        # Wait for more text to decide
+                        break
+                    if lookahead[0] == '"':
+                        self.start = self.pos
+                        self.depth = 1
+                self.pos += 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    candidate = self.buffer[self.start:self.pos + 1]
+                    self.start = None
+                    try:
+                        call = _to_tool_call(json.loads(candidate))
+                    except json.JSONDecodeError:
+                        call = None
+                    if call:
+                        calls.append(call)
+            self.pos += 1
+
+        if self.start is None:
+            # Drop scanned text that can no longer be part of a call
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        return calls
+
+
+def parse_tool_calls(text: str) -> List[ToolCall]:
+    return ToolCallParser().feed(text)
+
+
+def format_tool_result(result: Any) -> str:
+    """
+    Flatten an MCP CallToolResult into text for history and the prompt.
+    """
+    content = getattr(result, "content", None)
+    if content is None:
+        return str(result)
+    parts = []
+    for item in content:
+        text = getattr(item, "text", None)
+        if text is not None:
+            parts.append(text)
+        elif hasattr(item, "model_dump"):
+            parts.append(json.dumps(item.model_dump(mode="json")))
+        else:
+            parts.append(str(item))
+    text = "\n".join(parts)
+    if getattr(result, "isError", False):
+        return f"Error: {text}"
+    return text
@@ -1,69 +1,158 @@
 import asyncio
 from contextlib import asynccontextmanager
-from typing import Optional, Dict, Any, List
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import StreamingResponse, FileResponse
+from typing import Callable, Optional, Dict, Any, List
+from fastapi import FastAPI, HTTPException, Body, Request, Header
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import os
+import tempfile
 
 from core.config import settings, MCPServerConfig
-from core.chat_engine import ChatEngine
+from core.chat_engine import ChatEngine, create_llm, SYSTEM_PROMPT
+from core.engine_pool import EnginePool
 from core.llm.base import BaseLLM
 from core.llm.local import LocalLLM
 from core.llm.cloud import OpenAILLM, GeminiLLM, AnthropicLLM
+from core.llm.rate_limit import (
+    RateLimitedLLM,
+    get_provider_limiter,
+    flow_key,
+    ESTIMATED_OUTPUT_TOKENS,
+)
 from core.mcp.client import MCPClientManager
 from core.memory.manager import MemoryManager
+from core.memory.vector_index import get_vector_index
 
 # Global State
 class GlobalState:
-    llm: Optional[BaseLLM] = None
-    mcp: Optional[MCPClientManager] = None
+    def __init__(self):
+        self.llm: Optional[RateLimitedLLM] = None
+        self.mcp: Optional[MCPClientManager] = None
+        # Model loading runs in the background; `llm_ready` is set once `llm` is usable.
+        self.llm_ready = asyncio.Event()
+        self.llm_status: str = "loading" # loading, warming, ready, error
+        self.llm_error: Optional[str] = None
+        self.llm_task: Optional[asyncio.Task] = None
+        # Warm ChatEngines, one per active conversation
+        self.memory = MemoryManager()
+        self.engines = EnginePool(
+            max_engines=settings.ENGINE_POOL_SIZE,
+            idle_ttl=settings.ENGINE_IDLE_TTL,
+            max_bytes=settings.ENGINE_POOL_MAX_BYTES
+        )
+        self.sweep_task: Optional[asyncio.Task] = None
 
 state = GlobalState()
 
+async def _warmup_prompt() -> str:
+    # Include the tool schemas; a bare SYSTEM_PROMPT is a prefix no real turn reuses for long
+    if not state.mcp:
+        return SYSTEM_PROMPT
+    return await ChatEngine(mcp=state.mcp, memory=state.memory).default_system_prompt()
+
+async def _load_llm(factory: Callable[[], BaseLLM], provider: str):
+    try:
+        # Constructing LocalLLM may download and load a large model; keep it off the event loop.
+        llm = await asyncio.to_thread(factory)
+    except Exception as e:
+        print(f"Failed to load LLM provider {provider}: {e}")
+        state.llm_status = "error"
+        state.llm_error = str(e)
+        return
+
+    llm = RateLimitedLLM(llm, get_provider_limiter(provider))
+    if settings.LLM_WARMUP:
+        state.llm_status = "warming"
+        try:
+            await llm.warmup(await _warmup_prompt())
+        except Exception as e:
+            # A failed warmup only costs latency on the first request
+            print(f"LLM warmup failed: {e}")
+
+    state.llm = llm
+    state.llm_status = "ready"
+    state.llm_error = None
+    state.llm_ready.set()
+    print(f"LLM provider {provider} is ready")
+
+def start_llm_loading(factory: Callable[[], BaseLLM], provider: str) -> asyncio.Task:
+    """
+    Load a provider in the background. The current LLM (if any) keeps
+    serving until the new one is ready.
+    """
+    if state.llm_task and not state.llm_task.done():
+        state.llm_task.cancel()
+    state.llm_status = "loading"
+    state.llm_error = None
+    state.llm_task = asyncio.create_task(_load_llm(factory, provider))
+    return state.llm_task
+
+async def sweep_engines(interval: float = 60.0):
+    """
+    Evict idle engines even when no turns finish to trigger eviction.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        state.engines.evict()
+
+async def wait_for_llm() -> RateLimitedLLM:
+    """
+    Wait up to LLM_READY_TIMEOUT seconds for the model, or fail fast with 503.
+    """
+    if state.llm:
+        return state.llm
+    if state.llm_status != "error" and settings.LLM_READY_TIMEOUT > 0:
+        try:
+            await asyncio.wait_for(state.llm_ready.wait(), settings.LLM_READY_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+    if state.llm:
+        return state.llm
+    detail = f"Model failed to load: {state.llm_error}" if state.llm_status == "error" else "Model is still loading"
+    raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Initializing Database...")
-    await MemoryManager().init_db()
+    await state.memory.ensure_db()
     
     # Smart LLM Selection (Skip local download if cloud keys exist)
     if settings.DEFAULT_LLM_PROVIDER == "local":
         if settings.OPENAI_API_KEY:
             print("Detected OpenAI Key, switching default to OpenAI")
             settings.DEFAULT_LLM_PROVIDER = "openai"
-            state.llm = OpenAILLM()
         elif settings.GEMINI_API_KEY:
             print("Detected Gemini Key, switching default to Gemini")
             settings.DEFAULT_LLM_PROVIDER = "gemini"
-            state.llm = GeminiLLM()
         elif settings.ANTHROPIC_API_KEY:
             print("Detected Anthropic Key, switching default to Anthropic")
             settings.DEFAULT_LLM_PROVIDER = "anthropic"
-            state.llm = AnthropicLLM()
         else:
             print("No cloud keys detected, using Local LLM")
-            state.llm = LocalLLM()
-    else:
-        # Initialize based on configured provider
-        if settings.DEFAULT_LLM_PROVIDER == "openai":
-            state.llm = OpenAILLM()
-        elif settings.DEFAULT_LLM_PROVIDER == "gemini":
-            state.llm = GeminiLLM()
-        elif settings.DEFAULT_LLM_PROVIDER == "anthropic":
-            state.llm = AnthropicLLM()
-        else:
-            state.llm = LocalLLM()
 
-    # Initialize MCP
+    # Initialize MCP first, so the warmup prompt includes the tools
     state.mcp = MCPClientManager()
     await state.mcp.connect_all()
+
+    # Initialize based on configured provider, without blocking startup
+    provider = settings.DEFAULT_LLM_PROVIDER
+    start_llm_loading(lambda: create_llm(provider), provider)
+    
+    state.sweep_task = asyncio.create_task(sweep_engines())
     
     yield
     
     # Shutdown
+    if state.sweep_task:
+        state.sweep_task.cancel()
+    if settings.SEMANTIC_MEMORY_ENABLED:
+        # Index messages still queued
+        await get_vector_index(settings.SEMANTIC_MEMORY_PATH).close()
+    if state.llm_task and not state.llm_task.done():
+        state.llm_task.cancel()
     if state.mcp:
         await state.mcp.cleanup()
 
@@ -91,19 +180,48 @@ class ConfigUpdate(BaseModel):
     mcp_servers: Optional[List[Dict[str, Any]]] = None
 
 @app.post("/api/chat")
-async def chat_endpoint(request: ChatRequest):
-    engine = ChatEngine(
-        conversation_id=request.conversation_id,
-        llm=state.llm,
-        mcp=state.mcp
+async def chat_endpoint(request: ChatRequest, x_api_key: Optional[str] = Header(None)):
+    base_llm = await wait_for_llm()
+    # Waits for any turn already running on this conversation
+    lease = await state.engines.acquire(
+        request.conversation_id,
+        lambda conversation_id: ChatEngine(
+            conversation_id=conversation_id,
+            llm=base_llm,
+            mcp=state.mcp,
+            memory=state.memory
+        )
     )
-    await engine.initialize() # Ensures memory is ready
+    engine = lease.engine
+    # The MCP manager may have been replaced since the engine was created
+    engine.mcp = state.mcp
+
+    try:
+        # Queue fairly per API key (or conversation) before the response starts,
+        # so the wait can be reported in the headers.
+        llm = base_llm.for_flow(flow_key(x_api_key, engine.conversation_id))
+        # Estimated from what will be sent (history and tool schemas included), not just the new message
+        prompt_tokens = await engine.estimate_prompt_tokens(request.message)
+        admission = await llm.admit(prompt_tokens + ESTIMATED_OUTPUT_TOKENS)
+        llm.prepaid = admission
+    except BaseException:
+        lease.release()
+        raise
+    # The LLM may have been replaced since the engine was created
+    engine.llm = llm
     
     async def generate():
-        async for chunk in engine.chat(request.message):
-            yield chunk
+        try:
+            async for chunk in engine.chat(request.message):
+                yield chunk
+        finally:
+            lease.release()
 
-    return StreamingResponse(generate(), media_type="text/plain")
+    headers = {
+        "X-Queue-Depth": str(admission.queue_depth),
+        "X-Queue-Wait-Ms": str(round(admission.waited * 1000)),
+    }
+    return StreamingResponse(generate(), media_type="text/plain", headers=headers)
 
 @app.get("/api/conversations")
 async def list_conversations():
@@ -116,11 +234,81 @@ async def create_conversation(title: str = Body(..., embed=True)):
     id = await memory.create_conversation(title)
     return {"id": id, "title": title}
 
+@app.get("/api/export")
+async def export_conversations(before: Optional[str] = None):
+    memory = MemoryManager()
+    return StreamingResponse(memory.export_conversations(before=before), media_type="application/x-ndjson")
+
+@app.post("/api/import")
+async def import_conversations(request: Request):
+    # Spool the upload first so the import transaction only waits on local reads, not the client
+    with tempfile.TemporaryFile() as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+
+        memory = MemoryManager()
+        try:
+            count = await memory.import_conversations(upload)
+        except (ValueError, KeyError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid NDJSON: {e}")
+    return {"imported": count}
+
 @app.get("/api/history/{conversation_id}")
 async def get_history(conversation_id: int):
     memory = MemoryManager()
     return await memory.get_messages(conversation_id)
 
+@app.get("/api/blobs/{digest}")
+async def get_blob(digest: str):
+    memory = MemoryManager()
+    try:
+        path = memory.blobs.path(digest)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Blob not found")
+    # Served from disk with Range support, so large results can be paged without loading them
+    return FileResponse(path, media_type="text/plain; charset=utf-8")
+
+@app.get("/api/health")
+async def health():
+    """
+    Liveness: the process is serving requests. Readiness is reported in the body.
+    """
+    return {
+        "live": True,
+        "ready": state.llm is not None,
+        "llm": {
+            "provider": settings.DEFAULT_LLM_PROVIDER,
+            "status": state.llm_status,
+            "error": state.llm_error
+        }
+    }
+
+@app.get("/api/health/ready")
+async def readiness():
+    body = await health()
+    if not body["ready"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    if not state.llm:
+        return {}
+    return state.llm.limiter.stats()
+
+@app.get("/api/mcp/stats")
+async def mcp_stats():
+    if not state.mcp:
+        return []
+    return state.mcp.scheduler_stats()
+
+@app.get("/api/engines/stats")
+async def engine_stats():
+    return state.engines.stats()
+
 @app.get("/api/config")
 async def get_config():
     return {
@@ -132,7 +320,11 @@ async def get_config():
                 "command": s.command, 
                 "args": s.args, 
                 "url": s.url,
-                "headers": s.headers
+                "headers": s.headers,
+                "max_in_flight": s.max_in_flight,
+                "max_queue": s.max_queue,
+                "tool_timeout": s.tool_timeout,
+                "tool_timeouts": s.tool_timeouts
             } 
             for s in settings.MCP_SERVERS
         ]
@@ -147,14 +339,21 @@ async def update_config(config: ConfigUpdate):
         settings.DEFAULT_LLM_PROVIDER = config.llm_provider
         
         # Re-init LLM
-        if settings.DEFAULT_LLM_PROVIDER == "openai":
-            state.llm = OpenAILLM(api_key=config.openai_key)
-        elif settings.DEFAULT_LLM_PROVIDER == "gemini":
-            state.llm = GeminiLLM(api_key=config.gemini_key)
-        elif settings.DEFAULT_LLM_PROVIDER == "anthropic":
-            state.llm = AnthropicLLM(api_key=config.anthropic_key)
+        provider = settings.DEFAULT_LLM_PROVIDER
+        if provider == "openai":
+            factory = lambda: OpenAILLM(api_key=config.openai_key)
+        elif provider == "gemini":
+            factory = lambda: GeminiLLM(api_key=config.gemini_key)
+        elif provider == "anthropic":
+            factory = lambda: AnthropicLLM(api_key=config.anthropic_key)
         else:
-            state.llm = LocalLLM()
+            factory = LocalLLM
+        task = start_llm_loading(factory, provider)
+        if provider != "local":
+            # Cloud clients construct instantly; surface bad keys to the caller
+            await task
+            if state.llm_status == "error":
+                raise HTTPException(status_code=400, detail=state.llm_error)
             
     if config.mcp_servers is not None:
         # Update MCP servers
@@ -167,7 +366,11 @@ async def update_config(config: ConfigUpdate):
                 args=s.get("args", []),
                 env=s.get("env", {}),
                 url=s.get("url"),
-                headers=s.get("headers", {})
+                headers=s.get("headers", {}),
+                max_in_flight=s.get("max_in_flight", 4),
+                max_queue=s.get("max_queue", 64),
+                tool_timeout=s.get("tool_timeout", 60.0),
+                tool_timeouts=s.get("tool_timeouts", {})
             ))
         settings.MCP_SERVERS = new_servers
         
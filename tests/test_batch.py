@@ -0,0 +1,105 @@
+import pytest
+import json
+from core.batch import BatchRunner, completed_ids
+from core.llm.base import BaseLLM
+from core.llm.rate_limit import ProviderLimiter, RateLimitedLLM
+from core.mcp.client import MCPClientManager
+
+class EchoLLM(BaseLLM):
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = 0
+
+    async def chat_complete(self, messages, system_prompt=None):
+        return messages[-1]["content"]
+
+    async def chat_stream(self, messages, system_prompt=None):
+        self.calls += 1
+        if messages[-1]["content"] == self.fail_on:
+            raise RuntimeError("boom")
+        yield "echo: "
+        yield messages[-1]["content"]
+
+@pytest.mark.asyncio
+async def test_batch_runner_writes_results_and_resumes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from core.memory.manager import MemoryManager
+    await MemoryManager().init_db()
+
+    input_path = tmp_path / "prompts.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    input_path.write_text("\n".join([
+        json.dumps({"id": "a", "prompt": "one"}),
+        json.dumps({"id": "b", "prompt": "two"}),
+        json.dumps("three"),
+    ]) + "\n")
+
+    llm = EchoLLM(fail_on="two")
+    summary = await BatchRunner(llm, MCPClientManager(), concurrency=2).run(str(input_path), str(output_path))
+    assert (summary.completed, summary.failed, summary.skipped) == (2, 1, 0)
+
+    results = {r["id"]: r for r in map(json.loads, output_path.read_text().splitlines())}
+    assert results["a"]["response"] == "echo: one"
+    assert results[3]["response"] == "echo: three"
+    assert "error" in results["b"]
+    assert completed_ids(str(output_path)) == {"a", "3"}
+
+    # Resuming only retries the failed prompt
+    llm = EchoLLM()
+    summary = await BatchRunner(llm, MCPClientManager(), concurrency=2).run(str(input_path), str(output_path))
+    assert (summary.completed, summary.failed, summary.skipped) == (1, 0, 2)
+    assert llm.calls == 1
+
+@pytest.mark.asyncio
+async def test_token_bucket_spaces_requests():
+    import time
+    from core.llm.rate_limit import TokenBucket
+
+    bucket = TokenBucket(rate_per_minute=600, capacity=1)
+    start = time.monotonic()
+    assert await bucket.acquire() == pytest.approx(0, abs=0.01)
+    await bucket.acquire()
+    await bucket.acquire()
+    # 10 tokens per second, so two extra requests take about 0.2s
+    assert time.monotonic() - start >= 0.18
+
+class ToolCallingLLM(BaseLLM):
+    async def chat_complete(self, messages, system_prompt=None):
+        return "done"
+
+    async def chat_stream(self, messages, system_prompt=None):
+        if messages[-1]["role"] == "user" and messages[-1]["content"].startswith("Result of"):
+            yield "done"
+        else:
+            yield '{"tool": "lookup", "server": "kb", "arguments": {}}'
+
+class PriorityMCP(MCPClientManager):
+    def __init__(self):
+        super().__init__()
+        self.sessions = {"kb": object()}
+        self.priorities = []
+
+    async def list_tools(self):
+        return [{"name": "lookup", "server": "kb"}]
+
+    async def call_tool(self, server_name, tool_name, arguments, priority=None, timeout=None):
+        self.priorities.append(priority)
+        return "found"
+
+@pytest.mark.asyncio
+async def test_batch_tool_calls_run_at_background_priority(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from core.memory.manager import MemoryManager
+    from core.mcp.scheduler import PRIORITY_BACKGROUND
+    await MemoryManager().init_db()
+
+    input_path = tmp_path / "prompts.jsonl"
+    input_path.write_text(json.dumps("look it up") + "\n")
+    mcp = PriorityMCP()
+    limiter = ProviderLimiter("test", rpm=600)
+    llm = RateLimitedLLM(ToolCallingLLM(), limiter)
+    summary = await BatchRunner(llm, mcp).run(str(input_path), str(tmp_path / "results.jsonl"))
+    assert summary.completed == 1
+    assert mcp.priorities == [PRIORITY_BACKGROUND]
+    # Both model calls (the tool call and the answer) were admitted by the provider limiter
+    assert limiter.admitted == 2
@@ -33,3 +33,154 @@ async def test_memory_manager():
     # Cleanup
     if os.path.exists(db_path):
         os.remove(db_path)
+
+@pytest.mark.asyncio
+async def test_memory_manager_spills_large_tool_results(tmp_path):
+    from core.config import settings
+    from core.memory.blob_store import parse_handle
+
+    manager = MemoryManager(db_path=str(tmp_path / "history.db"), blob_path=str(tmp_path / "blobs"))
+    await manager.init_db()
+    conv_id = await manager.create_conversation("Blobs")
+
+    payload = "x" * (settings.BLOB_THRESHOLD_BYTES + 1)
+    await manager.add_message(conv_id, "tool", payload)
+    await manager.add_message(conv_id, "assistant", payload)
+
+    msgs = await manager.get_messages(conv_id)
+    handle = parse_handle(msgs[0]["content"])
+    assert handle is not None
+    assert handle[1] == len(payload)
+    assert len(msgs[0]["content"]) < len(payload)
+    assert manager.resolve_content(msgs[0]["content"]) == payload
+    # Only tool results are spilled
+    assert msgs[1]["content"] == payload
+
+    # Referenced blobs survive GC, orphans are collected
+    orphan = manager.blobs.put(b"orphan")
+    assert await manager.gc_blobs(grace_seconds=0) == 1
+    assert not manager.blobs.exists(orphan)
+    assert manager.blobs.exists(handle[0])
+
+@pytest.mark.asyncio
+async def test_export_import_and_archive(tmp_path):
+    import gzip
+    import json
+    import aiosqlite
+
+    source = MemoryManager(db_path=str(tmp_path / "source.db"), blob_path=str(tmp_path / "blobs"))
+    await source.init_db()
+    old_id = await source.create_conversation("Old Chat")
+    await source.add_message(old_id, "user", "Hello")
+    await source.add_message(old_id, "assistant", "Hi there")
+    new_id = await source.create_conversation("New Chat")
+    await source.add_message(new_id, "user", "Recent")
+
+    lines = [line async for line in source.export_conversations()]
+    assert len(lines) == 2
+    assert json.loads(lines[0])["messages"][1]["content"] == "Hi there"
+
+    target = MemoryManager(db_path=str(tmp_path / "target.db"), blob_path=str(tmp_path / "blobs"))
+    await target.init_db()
+    assert await target.import_conversations(lines, batch_size=1) == 2
+    convs = await target.list_conversations()
+    assert sorted(c["title"] for c in convs) == ["New Chat", "Old Chat"]
+    imported_old = next(c["id"] for c in convs if c["title"] == "Old Chat")
+    assert [m["content"] for m in await target.get_messages(imported_old)] == ["Hello", "Hi there"]
+
+    # Age the first conversation and archive it
+    async with aiosqlite.connect(source.db_path) as db:
+        await db.execute("UPDATE conversations SET created_at = datetime('now', '-40 days') WHERE id = ?", (old_id,))
+        await db.execute("UPDATE messages SET created_at = datetime('now', '-40 days') WHERE conversation_id = ?", (old_id,))
+        await db.commit()
+
+    # Started long ago but used recently: kept
+    active_id = await source.create_conversation("Old But Active")
+    await source.add_message(active_id, "user", "Still here")
+    async with aiosqlite.connect(source.db_path) as db:
+        await db.execute("UPDATE conversations SET created_at = datetime('now', '-90 days') WHERE id = ?", (active_id,))
+        await db.commit()
+
+    archive_path = str(tmp_path / "archive" / "history.ndjson.gz")
+    assert await source.archive_conversations(30, archive_path) == 1
+    assert sorted(c["id"] for c in await source.list_conversations()) == [new_id, active_id]
+    assert await source.get_messages(old_id) == []
+
+    with gzip.open(archive_path, "rt") as f:
+        archived = [json.loads(line) for line in f]
+    assert [r["title"] for r in archived] == ["Old Chat"]
+    assert len(archived[0]["messages"]) == 2
+
+@pytest.mark.asyncio
+async def test_export_resolves_only_spilled_roles(tmp_path):
+    import json
+    from core.config import settings
+    from core.memory.blob_store import format_handle, parse_handle
+
+    manager = MemoryManager(db_path=str(tmp_path / "history.db"), blob_path=str(tmp_path / "blobs"))
+    await manager.init_db()
+    conv_id = await manager.create_conversation("Handles")
+    lookalike = format_handle(manager.blobs.put(b"secret"), 6, "")
+    await manager.add_message(conv_id, "user", lookalike)
+    stored = await manager.add_message(conv_id, "tool", "y" * (settings.BLOB_THRESHOLD_BYTES + 1))
+    manager.blobs.delete(parse_handle(stored)[0])
+
+    record = json.loads([line async for line in manager.export_conversations()][0])
+    # A user message that looks like a handle is exported as typed, and pins no blob
+    assert record["messages"][0]["content"] == lookalike
+    # A tool result whose blob is gone keeps its stored preview
+    assert record["messages"][1]["content"] == stored
+    assert await manager.gc_blobs(grace_seconds=0) == 1
+
+@pytest.mark.asyncio
+async def test_archive_keeps_messages_added_while_archiving(tmp_path):
+    import aiosqlite
+
+    manager = MemoryManager(db_path=str(tmp_path / "history.db"), blob_path=str(tmp_path / "blobs"))
+    await manager.init_db()
+    conv_id = await manager.create_conversation("Idle")
+    await manager.add_message(conv_id, "user", "old")
+    async with aiosqlite.connect(manager.db_path) as db:
+        await db.execute("UPDATE messages SET created_at = datetime('now', '-40 days')")
+        await db.commit()
+
+    records = manager._conversation_records
+
+    async def records_then_new_message(db, conversation_ids, max_message_id=None):
+        async for record in records(db, conversation_ids, max_message_id):
+            yield record
+        # The conversation is resumed after it was written to the archive
+        await manager.add_message(conv_id, "user", "new")
+
+    manager._conversation_records = records_then_new_message
+    assert await manager.archive_conversations(30, str(tmp_path / "archive.ndjson.gz")) == 0
+    assert await manager.get_messages(conv_id) == [{"role": "user", "content": "new"}]
+
+@pytest.mark.asyncio
+async def test_compressed_message_storage(tmp_path):
+    pytest.importorskip("zstandard")
+    import aiosqlite
+
+    db_path = str(tmp_path / "history.db")
+    plain = MemoryManager(db_path=db_path, blob_path=str(tmp_path / "blobs"))
+    await plain.init_db()
+    conv_id = await plain.create_conversation("Compressed")
+    texts = [f"Tool output line {i}: status=ok, items=[alpha, beta, gamma], elapsed={i}ms " * 8 for i in range(300)]
+    for text in texts[:200]:
+        await plain.add_message(conv_id, "assistant", text)
+
+    compressed = MemoryManager(db_path=db_path, blob_path=str(tmp_path / "blobs"), compression="zstd")
+    await compressed.init_db()
+    dict_id = await compressed.train_compression_dict(dict_size=4096)
+    for text in texts[200:]:
+        await compressed.add_message(conv_id, "assistant", text)
+    assert await compressed.recompress_messages(batch_size=64) == 200
+
+    async with aiosqlite.connect(db_path) as db:
+        async with db.execute("SELECT DISTINCT codec FROM messages") as cursor:
+            codecs = {row[0] for row in await cursor.fetchall()}
+    assert codecs == {f"zstd:{dict_id}"}
+
+    # Readers without compression enabled still decode every row
+    msgs = await plain.get_messages(conv_id)
+    assert [m["content"] for m in msgs] == texts
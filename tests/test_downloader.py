@@ -0,0 +1,175 @@
+import pytest
+import hashlib
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from core.llm.downloader import ModelDownloader, ChecksumError, ensure_model
+
+PAYLOAD = os.urandom(300 * 1024 + 123)
+SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+CHUNK = 64 * 1024
+
+class RangeHandler(BaseHTTPRequestHandler):
+    ranges = True
+    etag = None
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        if self.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if self.etag:
+            self.send_header("X-Linked-Etag", f'"{self.etag}"')
+        self.end_headers()
+
+    def do_GET(self):
+        header = self.headers.get("Range")
+        self.requests.append(header)
+        if header and self.ranges:
+            start, end = header.split("=")[1].split("-")
+            start, end = int(start), int(end)
+            body = PAYLOAD[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(PAYLOAD)}")
+        else:
+            body = PAYLOAD
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def server():
+    RangeHandler.ranges = True
+    RangeHandler.etag = None
+    RangeHandler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/model.gguf"
+    httpd.shutdown()
+
+def test_parallel_download_verifies_checksum(server, tmp_path):
+    dest = str(tmp_path / "models" / "model.gguf")
+    ModelDownloader(server, dest, sha256=SHA256, connections=4, chunk_size=CHUNK, progress=False).download()
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert len(RangeHandler.requests) == 5
+    assert not os.path.exists(dest + ".part")
+    assert not os.path.exists(dest + ".part.json")
+
+def test_download_resumes_from_manifest(server, tmp_path):
+    dest = str(tmp_path / "model.gguf")
+    # Simulate a crash after the first two chunks were written
+    with open(dest + ".part", "wb") as f:
+        f.write(PAYLOAD[:2 * CHUNK])
+        f.truncate(len(PAYLOAD))
+    with open(dest + ".part.json", "w") as f:
+        json.dump({"size": len(PAYLOAD), "chunk_size": CHUNK, "done": [0, 1]}, f)
+
+    ModelDownloader(server, dest, sha256=SHA256, chunk_size=CHUNK, progress=False).download()
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert sorted(RangeHandler.requests) == [
+        f"bytes={2 * CHUNK}-{3 * CHUNK - 1}",
+        f"bytes={3 * CHUNK}-{4 * CHUNK - 1}",
+        f"bytes={4 * CHUNK}-{len(PAYLOAD) - 1}",
+    ]
+
+def test_checksum_mismatch_leaves_no_file(server, tmp_path):
+    dest = str(tmp_path / "model.gguf")
+    with pytest.raises(ChecksumError):
+        ModelDownloader(server, dest, sha256="0" * 64, chunk_size=CHUNK, progress=False).download()
+    assert not os.path.exists(dest)
+    assert not os.path.exists(dest + ".part")
+
+def test_falls_back_without_range_support(server, tmp_path):
+    RangeHandler.ranges = False
+    dest = str(tmp_path / "model.gguf")
+    ModelDownloader(server, dest, sha256=SHA256, chunk_size=CHUNK, progress=False).download()
+    assert RangeHandler.requests == [None]
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+
+def test_ensure_model_uses_shared_cache(server, tmp_path):
+    cache = str(tmp_path / "cache")
+    first = str(tmp_path / "deploy1" / "model.gguf")
+    second = str(tmp_path / "deploy2" / "model.gguf")
+    ensure_model(server, first, sha256=SHA256, cache_dir=cache, chunk_size=CHUNK, progress=False)
+    requests_after_first = len(RangeHandler.requests)
+    ensure_model(server, second, sha256=SHA256, cache_dir=cache, chunk_size=CHUNK, progress=False)
+
+    assert len(RangeHandler.requests) == requests_after_first
+    with open(second, "rb") as f:
+        assert f.read() == PAYLOAD
+
+    # A corrupt local copy is detected and replaced
+    os.remove(first + ".sha256")
+    os.remove(first)
+    with open(first, "wb") as f:
+        f.write(b"truncated")
+    ensure_model(server, first, sha256=SHA256, cache_dir=cache, chunk_size=CHUNK, progress=False)
+    with open(first, "rb") as f:
+        assert f.read() == PAYLOAD
+
+def test_ensure_model_without_checksum_replaces_truncated_file(server, tmp_path):
+    dest = str(tmp_path / "model.gguf")
+    with open(dest, "wb") as f:
+        f.write(PAYLOAD[:1024])
+
+    # No checksum anywhere: the size from HEAD catches the truncated file
+    ensure_model(server, dest, chunk_size=CHUNK, progress=False)
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert not os.path.exists(dest + ".sha256")
+
+def test_ensure_model_uses_advertised_checksum(server, tmp_path):
+    RangeHandler.etag = SHA256
+    dest = str(tmp_path / "model.gguf")
+    ensure_model(server, dest, chunk_size=CHUNK, progress=False)
+    with open(dest + ".sha256") as f:
+        assert f.read() == SHA256
+
+    # Verified files are used without contacting the server
+    requests_before = len(RangeHandler.requests)
+    ensure_model("http://127.0.0.1:1/unreachable", dest, progress=False)
+    assert len(RangeHandler.requests) == requests_before
+
+    # A same-size corrupt file fails the advertised checksum
+    RangeHandler.etag = "0" * 64
+    other = str(tmp_path / "other.gguf")
+    with open(other, "wb") as f:
+        f.write(b"x" * len(PAYLOAD))
+    with pytest.raises(ChecksumError):
+        ensure_model(server, other, chunk_size=CHUNK, progress=False)
+
+def test_concurrent_ensure_model_downloads_once(server, tmp_path):
+    cache = str(tmp_path / "cache")
+    dests = [str(tmp_path / f"deploy{i}" / "model.gguf") for i in range(2)]
+    barrier = threading.Barrier(len(dests))
+    errors = []
+
+    def deploy(dest):
+        barrier.wait()
+        try:
+            ensure_model(server, dest, sha256=SHA256, cache_dir=cache, chunk_size=CHUNK, progress=False)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=deploy, args=(dest,)) for dest in dests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    # The second deployment waited for the first one's download instead of racing it
+    assert len(RangeHandler.requests) == 5
+    for dest in dests:
+        with open(dest, "rb") as f:
+            assert f.read() == PAYLOAD
@@ -0,0 +1,131 @@
+import pytest
+import asyncio
+import os
+from core.engine_pool import EnginePool
+from core.chat_engine import ChatEngine
+from core.llm.base import BaseLLM
+from core.mcp.client import MCPClientManager
+from core.memory.manager import MemoryManager
+
+class EchoLLM(BaseLLM):
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.seen = []
+
+    async def chat_complete(self, messages, system_prompt=None):
+        return "ok"
+
+    async def chat_stream(self, messages, system_prompt=None):
+        self.seen.append([m["content"] for m in messages])
+        await asyncio.sleep(self.delay)
+        yield f"reply {len(messages)}"
+
+def make_factory(tmp_path, llm):
+    memory = MemoryManager(db_path=os.path.join(tmp_path, "test.db"), blob_path=os.path.join(tmp_path, "blobs"))
+    mcp = MCPClientManager()
+    mcp.sessions = {"none": None} # Skip connecting to configured servers
+
+    async def no_tools():
+        return []
+    mcp.list_tools = no_tools
+
+    return lambda conversation_id: ChatEngine(conversation_id=conversation_id, llm=llm, mcp=mcp, memory=memory)
+
+async def run_turn(pool, factory, conversation_id, message):
+    lease = await pool.acquire(conversation_id, factory)
+    try:
+        return lease.engine.conversation_id, "".join([chunk async for chunk in lease.engine.chat(message)])
+    finally:
+        lease.release()
+
+@pytest.mark.asyncio
+async def test_engine_reused_with_warm_history(tmp_path):
+    llm = EchoLLM()
+    factory = make_factory(tmp_path, llm)
+    pool = EnginePool()
+
+    conversation_id, reply = await run_turn(pool, factory, None, "first")
+    assert reply == "reply 1"
+    engine = pool._entries[conversation_id].engine
+
+    _, reply = await run_turn(pool, factory, conversation_id, "second")
+    assert reply == "reply 3"
+    assert pool._entries[conversation_id].engine is engine
+    assert pool.stats()["hits"] == 1
+
+    # Warm history matches what is stored
+    stored = await engine.memory.get_messages(conversation_id)
+    assert engine.history == stored
+    assert llm.seen[-1] == ["first", "reply 1", "second"]
+
+@pytest.mark.asyncio
+async def test_turns_on_one_conversation_are_serialized(tmp_path):
+    llm = EchoLLM(delay=0.05)
+    factory = make_factory(tmp_path, llm)
+    pool = EnginePool()
+    conversation_id, _ = await run_turn(pool, factory, None, "start")
+
+    await asyncio.gather(*[run_turn(pool, factory, conversation_id, f"m{i}") for i in range(3)])
+
+    # Each turn saw every earlier turn, so none ran concurrently
+    lengths = [len(seen) for seen in llm.seen[1:]]
+    assert lengths == [3, 5, 7]
+    messages = await MemoryManager(db_path=os.path.join(tmp_path, "test.db")).get_messages(conversation_id)
+    assert len(messages) == 8
+
+@pytest.mark.asyncio
+async def test_eviction_by_size_and_idle_ttl(tmp_path):
+    factory = make_factory(tmp_path, EchoLLM())
+    pool = EnginePool(max_engines=2)
+
+    ids = [(await run_turn(pool, factory, None, "hi"))[0] for _ in range(3)]
+    assert list(pool._entries) == ids[1:]
+    assert pool.evictions == 1
+
+    # Engines in use are kept even when idle for too long
+    pool.idle_ttl = 0
+    lease = await pool.acquire(ids[2], factory)
+    await asyncio.sleep(0.01)
+    pool.evict()
+    assert list(pool._entries) == [ids[2]]
+    lease.release()
+    assert len(pool) == 0
+
+@pytest.mark.asyncio
+async def test_prompt_estimate_covers_history_and_tools(tmp_path):
+    factory = make_factory(tmp_path, EchoLLM())
+    pool = EnginePool()
+    conversation_id, _ = await run_turn(pool, factory, None, "x" * 4000)
+
+    engine = pool._entries[conversation_id].engine
+    # The earlier 4000-character message is replayed, so it counts
+    assert await engine.estimate_prompt_tokens("hi") >= 1000
+
+    async def one_tool():
+        return [{"name": "read_file", "server": "fs", "description": "y" * 4000}]
+    engine.mcp.list_tools = one_tool
+    assert await engine.estimate_prompt_tokens("hi") >= 2000
+    # Estimating stores nothing
+    assert len(engine.history) == 2
+
+@pytest.mark.asyncio
+async def test_chat_reuses_tool_selection_from_estimate(tmp_path):
+    factory = make_factory(tmp_path, EchoLLM())
+    pool = EnginePool()
+    lease = await pool.acquire(None, factory)
+    engine = lease.engine
+    calls = []
+
+    async def list_tools():
+        calls.append(1)
+        return []
+    engine.mcp.list_tools = list_tools
+
+    await engine.estimate_prompt_tokens("hi")
+    [chunk async for chunk in engine.chat("hi")]
+    assert len(calls) == 1
+
+    # A turn that was not estimated selects its own tools
+    [chunk async for chunk in engine.chat("again")]
+    assert len(calls) == 2
+    lease.release()
@@ -0,0 +1,60 @@
+import pytest
+import asyncio
+from core.llm.base import BaseLLM
+from core.llm.rate_limit import ProviderLimiter, RateLimitedLLM, flow_key
+
+class CountingLLM(BaseLLM):
+    async def chat_complete(self, messages, system_prompt=None):
+        return "x" * 400
+
+    async def chat_stream(self, messages, system_prompt=None):
+        yield "x" * 400
+
+@pytest.mark.asyncio
+async def test_limiter_interleaves_flows_fairly():
+    # 6000 rpm with a burst of 1: one request every 10ms
+    limiter = ProviderLimiter("test", rpm=6000)
+    limiter.requests.capacity = 1
+    limiter.requests.tokens = 0
+    order = []
+
+    async def request(flow, i):
+        await limiter.acquire(flow, estimated_tokens=10)
+        order.append((flow, i))
+
+    # A bursty flow queues five requests before a second flow sends one
+    tasks = [asyncio.create_task(request("busy", i)) for i in range(5)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(request("quiet", 0)))
+    await asyncio.gather(*tasks)
+
+    assert order.index(("quiet", 0)) <= 1
+    stats = limiter.stats()
+    assert stats["admitted"] == 6
+    assert stats["queue_depth"] == 0
+    assert stats["max_wait_ms"] > 0
+
+@pytest.mark.asyncio
+async def test_rate_limited_llm_reconciles_tokens():
+    limiter = ProviderLimiter("test", tpm=10000)
+    llm = RateLimitedLLM(CountingLLM(), limiter).for_flow(flow_key(conversation_id=1))
+    before = limiter.tokens.tokens
+
+    chunks = [c async for c in llm.chat_stream([{"role": "user", "content": "hi" * 20}])]
+    assert chunks == ["x" * 400]
+    # Charged for ~10 prompt + 100 output tokens, not the 512-token output estimate
+    used = before - limiter.tokens.tokens
+    assert 100 <= used < 200
+
+    # A prepaid admission is consumed instead of queuing again
+    llm.prepaid = await llm.admit(50)
+    admitted = limiter.admitted
+    await llm.chat_complete([{"role": "user", "content": "hi"}])
+    assert limiter.admitted == admitted
+    assert llm.prepaid is None
+
+def test_flow_key_hides_api_keys():
+    key = flow_key(api_key="sk-secret")
+    assert "sk-secret" not in key
+    assert key == flow_key(api_key="sk-secret")
+    assert flow_key(conversation_id=7) == "conversation:7"
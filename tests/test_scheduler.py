@@ -0,0 +1,75 @@
+import pytest
+import asyncio
+from core.mcp.scheduler import (
+    ToolCallScheduler,
+    QueueFullError,
+    ToolCallTimeoutError,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BACKGROUND,
+)
+
+@pytest.mark.asyncio
+async def test_scheduler_limits_in_flight():
+    scheduler = ToolCallScheduler("test", max_in_flight=2, max_queue=10)
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return "ok"
+
+    results = await asyncio.gather(*[scheduler.run(call) for _ in range(6)])
+    assert results == ["ok"] * 6
+    assert peak == 2
+    assert scheduler.stats()["completed"] == 6
+    assert scheduler.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_scheduler_priority_and_queue_bound():
+    scheduler = ToolCallScheduler("test", max_in_flight=1, max_queue=2)
+    gate = asyncio.Event()
+    order = []
+
+    async def blocker():
+        await gate.wait()
+
+    def make(label):
+        async def call():
+            order.append(label)
+        return call
+
+    first = asyncio.create_task(scheduler.run(blocker))
+    await asyncio.sleep(0)
+    background = asyncio.create_task(scheduler.run(make("background"), priority=PRIORITY_BACKGROUND))
+    interactive = asyncio.create_task(scheduler.run(make("interactive"), priority=PRIORITY_INTERACTIVE))
+    await asyncio.sleep(0)
+    assert scheduler.queued == 2
+
+    with pytest.raises(QueueFullError):
+        await scheduler.run(make("overflow"))
+
+    gate.set()
+    await asyncio.gather(first, background, interactive)
+    assert order == ["interactive", "background"]
+    assert scheduler.stats()["rejected"] == 1
+
+@pytest.mark.asyncio
+async def test_scheduler_timeout_releases_slot():
+    scheduler = ToolCallScheduler("test", max_in_flight=1)
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def fast():
+        return 42
+
+    with pytest.raises(ToolCallTimeoutError):
+        await scheduler.run(slow, timeout=0.05)
+
+    assert await scheduler.run(fast) == 42
+    assert scheduler.stats()["timed_out"] == 1
+    assert scheduler.in_flight == 0
@@ -0,0 +1,113 @@
+import pytest
+import time
+import httpx
+from httpx import ASGITransport
+from core.llm.base import BaseLLM
+
+class SlowLoadingLLM(BaseLLM):
+    def __init__(self):
+        time.sleep(0.3)
+
+    async def chat_complete(self, messages, system_prompt=None):
+        return "ok"
+
+    async def chat_stream(self, messages, system_prompt=None):
+        yield "ok"
+
+@pytest.mark.asyncio
+async def test_server_starts_before_model_is_ready(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import server.app as server
+    from core.config import settings
+
+    monkeypatch.setattr(server, "create_llm", lambda provider: SlowLoadingLLM())
+    monkeypatch.setattr(settings, "MCP_SERVERS", [])
+    monkeypatch.setattr(settings, "LLM_READY_TIMEOUT", 0)
+    server.state = server.GlobalState()
+
+    async with server.lifespan(server.app):
+        async with httpx.AsyncClient(transport=ASGITransport(app=server.app), base_url="http://test") as client:
+            # Other endpoints serve while the model loads
+            assert (await client.get("/api/config")).status_code == 200
+            health = (await client.get("/api/health")).json()
+            assert health["live"] is True
+            assert health["ready"] is False
+            assert (await client.get("/api/health/ready")).status_code == 503
+            assert (await client.post("/api/chat", json={"message": "hi"})).status_code == 503
+
+            await server.state.llm_task
+            assert (await client.get("/api/health/ready")).status_code == 200
+            response = await client.post("/api/chat", json={"message": "hi"})
+            assert response.status_code == 200
+            assert response.text == "ok"
+
+            # Follow-up turns reuse the pooled engine
+            conversation_id = (await client.get("/api/conversations")).json()[0]["id"]
+            response = await client.post("/api/chat", json={"message": "again", "conversation_id": conversation_id})
+            assert response.text == "ok"
+            stats = (await client.get("/api/engines/stats")).json()
+            assert stats["engines"] == 1
+            assert stats["hits"] == 1
+
+class WarmupRecordingLLM(SlowLoadingLLM):
+    def __init__(self):
+        self.warmed = None
+
+    async def warmup(self, system_prompt=None):
+        self.warmed = system_prompt
+
+@pytest.mark.asyncio
+async def test_warmup_uses_system_prompt_with_tools(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import server.app as server
+    from core.config import settings
+
+    llm = WarmupRecordingLLM()
+    tool = {"name": "read_file", "server": "fs", "description": "Read a file"}
+
+    async def list_tools(self):
+        return [tool]
+
+    monkeypatch.setattr(server.MCPClientManager, "list_tools", list_tools)
+    monkeypatch.setattr(server, "create_llm", lambda provider: llm)
+    monkeypatch.setattr(settings, "MCP_SERVERS", [])
+    monkeypatch.setattr(settings, "LLM_WARMUP", True)
+    server.state = server.GlobalState()
+
+    async with server.lifespan(server.app):
+        await server.state.llm_task
+        assert llm.warmed.startswith(server.SYSTEM_PROMPT)
+        assert '"read_file"' in llm.warmed
+
+@pytest.mark.asyncio
+async def test_import_spools_upload(tmp_path, monkeypatch):
+    import json
+    monkeypatch.chdir(tmp_path)
+    import server.app as server
+
+    lines = [json.dumps({"title": f"Chat {i}", "messages": [{"role": "user", "content": "hi"}]}) for i in range(3)]
+
+    async def body():
+        for line in lines:
+            yield (line + "\n").encode()
+
+    await server.MemoryManager().init_db()
+    async with httpx.AsyncClient(transport=ASGITransport(app=server.app), base_url="http://test") as client:
+        response = await client.post("/api/import", content=body())
+        assert response.json() == {"imported": 3}
+        response = await client.post("/api/import", content=b"not json\n")
+        assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_blob_endpoint_serves_ranges(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import server.app as server
+
+    digest = server.MemoryManager().blobs.put(b"0123456789")
+    async with httpx.AsyncClient(transport=ASGITransport(app=server.app), base_url="http://test") as client:
+        assert (await client.get(f"/api/blobs/{digest}")).text == "0123456789"
+        response = await client.get(f"/api/blobs/{digest}", headers={"Range": "bytes=2-5"})
+        assert response.status_code == 206
+        assert response.text == "2345"
+        assert (await client.get("/api/blobs/" + "0" * 64)).status_code == 404
+        assert (await client.get("/api/blobs/not-a-digest")).status_code == 404
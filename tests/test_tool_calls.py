@@ -0,0 +1,152 @@
+import pytest
+import asyncio
+from core.tool_calls import ToolCallParser, parse_tool_calls
+
+def test_parser_emits_call_when_json_closes():
+    parser = ToolCallParser()
+    text = 'Let me check.\n```json\n{"tool": "read_file", "server": "fs", "arguments": {"path": "a{b}.txt"}}\n```\nDone.'
+    calls = []
+    for i in range(0, len(text), 7):
+        calls += parser.feed(text[i:i + 7])
+        if calls:
+            # Emitted as soon as the closing brace arrives, before the fence closes
+            assert i < text.index("```\nDone")
+            break
+    assert len(calls) == 1
+    assert calls[0].tool == "read_file"
+    assert calls[0].server == "fs"
+    assert calls[0].arguments == {"path": "a{b}.txt"}
+
+def test_parser_ignores_prose_braces_and_non_tool_json():
+    text = 'Sets look like {1, 2}. Config: {"name": "x"}. Call {"tool": "add", "arguments": {"a": 1, "b": 2}}'
+    calls = parse_tool_calls(text)
+    assert [(c.tool, c.server, c.arguments) for c in calls] == [("add", None, {"a": 1, "b": 2})]
+
+class StreamingLLM:
+    def __init__(self, responses):
+        self.responses = responses
+        self.dispatched_during_stream = None
+
+    async def chat_stream(self, messages, system_prompt=None):
+        text = self.responses.pop(0)
+        for i in range(0, len(text), 5):
+            yield text[i:i + 5]
+            await asyncio.sleep(0)
+        if self.dispatched_during_stream is None:
+            self.dispatched_during_stream = self.mcp.calls[:]
+
+class FakeMCP:
+    def __init__(self):
+        self.sessions = {"fs": object()}
+        self.calls = []
+
+    async def list_tools(self):
+        return [
+            {"name": "read_file", "server": "fs", "annotations": {"readOnlyHint": True}},
+            {"name": "write_file", "server": "fs", "annotations": {"readOnlyHint": False}},
+        ]
+
+    async def call_tool(self, server, tool, arguments, priority=None):
+        self.calls.append(tool)
+        return f"{tool} ok"
+
+@pytest.mark.asyncio
+async def test_chat_engine_dispatches_read_only_tools_speculatively(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from core.chat_engine import ChatEngine
+
+    mcp = FakeMCP()
+    llm = StreamingLLM([
+        '```json\n{"tool": "read_file", "server": "fs", "arguments": {"path": "a"}}\n```\n'
+        '```json\n{"tool": "write_file", "server": "fs", "arguments": {"path": "b"}}\n```\n'
+        'Working on it, this takes a while to say.',
+        "All done.",
+    ])
+    llm.mcp = mcp
+    engine = ChatEngine(llm=llm, mcp=mcp)
+    await engine.initialize()
+
+    output = "".join([chunk async for chunk in engine.chat("copy a to b")])
+    assert "All done." in output
+    # Read-only call started before the stream finished; the write waited for confirmation
+    assert llm.dispatched_during_stream == ["read_file"]
+    assert mcp.calls == ["read_file", "write_file"]
+
+    history = await engine.memory.get_messages(engine.conversation_id)
+    assert [m["role"] for m in history] == ["user", "assistant", "tool", "tool", "assistant"]
+    assert history[2]["content"].endswith("read_file ok")
+
+class RecordingLLM:
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    async def chat_stream(self, messages, system_prompt=None):
+        self.calls.append(messages)
+        yield self.responses.pop(0)
+
+class BigResultMCP(FakeMCP):
+    async def call_tool(self, server, tool, arguments, priority=None):
+        self.calls.append(tool)
+        return "x" * 20000 + "THE END"
+
+@pytest.mark.asyncio
+async def test_spilled_tool_result_is_sent_in_full_during_the_turn(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from core.chat_engine import ChatEngine
+    from core.config import settings
+
+    monkeypatch.setattr(settings, "BLOB_THRESHOLD_BYTES", 1024)
+    mcp = BigResultMCP()
+    llm = RecordingLLM([
+        '{"tool": "read_file", "server": "fs", "arguments": {"path": "a"}}',
+        "It ends with THE END.",
+        "Anything else?",
+    ])
+    engine = ChatEngine(llm=llm, mcp=mcp)
+    await engine.initialize()
+
+    [chunk async for chunk in engine.chat("read a")]
+    # The round after the call sees the whole result
+    assert llm.calls[1][-1]["content"].endswith("THE END")
+    assert len(llm.calls[1][-1]["content"]) > 20000
+
+    # Later turns see the compact handle
+    [chunk async for chunk in engine.chat("thanks")]
+    assert llm.calls[2][2]["content"].startswith("[blob sha256:")
+
+class SlowSecondCallMCP(FakeMCP):
+    def __init__(self):
+        super().__init__()
+        self.cancelled = []
+
+    async def call_tool(self, server, tool, arguments, priority=None):
+        if arguments.get("path") == "slow":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.cancelled.append(arguments["path"])
+                raise
+        return "ok"
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_pending_speculative_calls(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from core.chat_engine import ChatEngine
+
+    mcp = SlowSecondCallMCP()
+    llm = RecordingLLM([
+        '{"tool": "read_file", "server": "fs", "arguments": {"path": "fast"}}'
+        '{"tool": "read_file", "server": "fs", "arguments": {"path": "slow"}}',
+    ])
+    engine = ChatEngine(llm=llm, mcp=mcp)
+    await engine.initialize()
+
+    stream = engine.chat("read both")
+    async for chunk in stream:
+        if "Used tool" in chunk:
+            # The client goes away while the slow call is still running
+            break
+    await stream.aclose()
+    await asyncio.sleep(0)
+    assert mcp.cancelled == ["slow"]
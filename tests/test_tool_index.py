@@ -0,0 +1,60 @@
+from core.mcp.tool_index import ToolIndex, tokenize
+
+def make_tool(server, name, description, params=None):
+    return {
+        "server": server,
+        "name": name,
+        "description": description,
+        "inputSchema": {"type": "object", "properties": params or {}},
+    }
+
+CATALOG = [
+    make_tool("fs", "read_file", "Read the contents of a file", {"path": {"description": "File path"}}),
+    make_tool("fs", "list_directory", "List entries in a directory", {"path": {"description": "Directory path"}}),
+    make_tool("web", "fetchUrl", "Fetch a web page over HTTP", {"url": {"description": "URL to fetch"}}),
+    make_tool("math", "add", "Add two numbers", {"a": {}, "b": {}}),
+    make_tool("git", "git_log", "Show commit history of a repository"),
+]
+
+def test_tokenize_splits_names():
+    assert tokenize("fetchUrl") == ["fetch", "url"]
+    assert tokenize("read_file") == ["read", "file"]
+
+def test_tool_index_ranks_relevant_tools():
+    index = ToolIndex()
+    results = index.select(CATALOG, "please fetch https://example.com", k=1)
+    assert [t["name"] for t in results] == ["fetchUrl"]
+
+    results = index.select(CATALOG, "show the contents of this file", k=2, pinned=["math/add"])
+    names = [t["name"] for t in results]
+    assert names[0] == "add"
+    assert names[1] == "read_file"
+    assert len(names) == 3
+
+def test_tool_index_updates_incrementally():
+    index = ToolIndex()
+    assert index.update(CATALOG) == (5, 0)
+    assert index.update(CATALOG) == (0, 0)
+
+    changed = CATALOG[:-1] + [make_tool("git", "git_log", "Show commits and blame")]
+    assert index.update(changed) == (1, 1)
+    assert index.search("blame", 1)[0][0] == "git/git_log"
+
+    assert index.update(CATALOG[:2]) == (0, 3)
+    assert len(index) == 2
+    assert index.search("fetch", 5) == []
+
+def test_tool_index_fills_slots_when_nothing_matches():
+    index = ToolIndex()
+    catalog = CATALOG + [make_tool("misc", f"tool_{i}", f"Tool number {i}") for i in range(15)]
+    results = index.select(catalog, "hello, what's up?", k=3)
+    assert [t["name"] for t in results] == ["read_file", "list_directory", "fetchUrl"]
+
+    # Recently used tools come before catalog order
+    index.mark_used("git/git_log")
+    results = index.select(catalog, "yes, do it", k=2)
+    assert [t["name"] for t in results] == ["git_log", "read_file"]
+
+    # Relevant tools still come first
+    results = index.select(catalog, "fetch it", k=2)
+    assert [t["name"] for t in results] == ["fetchUrl", "git_log"]
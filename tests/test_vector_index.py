@@ -0,0 +1,159 @@
+import pytest
+import os
+from core.config import settings
+from core.chat_engine import ChatEngine
+from core.llm.base import BaseLLM
+from core.mcp.client import MCPClientManager
+from core.memory.manager import MemoryManager
+from core.memory.vector_index import VectorIndex, HashingEmbedder, chunk_text
+
+class RecordingLLM(BaseLLM):
+    def __init__(self):
+        self.calls = []
+
+    async def chat_complete(self, messages, system_prompt=None):
+        return "ok"
+
+    async def chat_stream(self, messages, system_prompt=None):
+        self.calls.append((messages, system_prompt))
+        yield "ok"
+
+def test_chunk_text_splits_on_whitespace():
+    text = " ".join(["word"] * 100)
+    chunks = chunk_text(text, size=50)
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert " ".join(chunks) == text
+
+def test_hashing_embedder_is_normalized_and_stable():
+    embedder = HashingEmbedder(dim=64)
+    vectors = embedder.embed(["the database migration failed", "the database migration failed", ""])
+    assert vectors.shape == (3, 64)
+    assert abs(float((vectors[0] ** 2).sum()) - 1.0) < 1e-5
+    assert (vectors[0] == vectors[1]).all()
+    assert not vectors[2].any()
+
+@pytest.mark.asyncio
+async def test_index_search_and_reload(tmp_path):
+    index = VectorIndex(str(tmp_path))
+    await index.index([
+        (1, "user", "How do I rotate the postgres database credentials?"),
+        (2, "user", "Write a haiku about autumn leaves"),
+        (3, "assistant", "Kubernetes pods restart when the liveness probe fails"),
+    ])
+    results = await index.search("rotate database credentials", k=2)
+    assert results[0]["conversation_id"] == 1
+    assert results[0]["score"] > results[-1]["score"]
+
+    await index.forget([1])
+    results = await index.search("rotate database credentials", k=1)
+    assert results[0]["conversation_id"] != 1
+
+    # A crash after appending vectors but before committing metadata leaves extra rows
+    with open(index.vectors_path, "ab") as f:
+        f.write(b"\0" * index.row_bytes * 2)
+    reopened = VectorIndex(str(tmp_path))
+    await reopened.ensure_ready()
+    assert reopened.count == 3
+    assert os.path.getsize(reopened.vectors_path) == 3 * reopened.row_bytes
+    assert (await reopened.search("liveness probe", k=1))[0]["conversation_id"] == 3
+
+@pytest.mark.asyncio
+async def test_first_search_does_not_truncate_concurrent_index(tmp_path):
+    import asyncio
+    index = VectorIndex(str(tmp_path))
+    await asyncio.gather(
+        index.index([(1, "user", "the deploy key lives in vault")]),
+        index.search("deploy key", k=1),
+    )
+    assert (await index.search("deploy key", k=1))[0]["score"] > 0.5
+
+@pytest.mark.asyncio
+async def test_search_limited_to_conversations(tmp_path):
+    index = VectorIndex(str(tmp_path))
+    await index.index([
+        (1, "user", "the api token for staging is abc"),
+        (2, "user", "the api token for production is xyz"),
+        (2, "assistant", "noted"),
+    ])
+    results = await index.search("api token for staging", k=5, conversation_ids=[2])
+    assert results and {r["conversation_id"] for r in results} == {2}
+    assert await index.search("api token", k=5, conversation_ids=[3]) == []
+
+@pytest.mark.asyncio
+async def test_background_indexing_batches(tmp_path):
+    index = VectorIndex(str(tmp_path), batch_size=8)
+    for i in range(20):
+        index.add(1, "user", f"message number {i} about topic {i}")
+    index.add(1, "tool", "tool output is not indexed")
+    await index.flush()
+    assert index.count == 20
+    await index.close()
+
+@pytest.mark.asyncio
+async def test_chat_engine_recalls_other_conversations(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SEMANTIC_MEMORY_RECENT_MESSAGES", 2)
+    monkeypatch.setattr(settings, "SEMANTIC_MEMORY_MIN_SCORE", 0.1)
+    memory = MemoryManager(db_path=os.path.join(tmp_path, "test.db"), blob_path=os.path.join(tmp_path, "blobs"))
+    await memory.init_db()
+    index = VectorIndex(os.path.join(tmp_path, "index"))
+    mcp = MCPClientManager()
+    mcp.sessions = {"none": None} # Skip connecting to configured servers
+
+    async def no_tools():
+        return []
+    mcp.list_tools = no_tools
+
+    llm = RecordingLLM()
+    first = ChatEngine(llm=llm, mcp=mcp, memory=memory, semantic=index)
+    await first.initialize()
+    async for _ in first.chat("My staging server hostname is orion-7.internal"):
+        pass
+    await index.flush()
+
+    second = ChatEngine(llm=llm, mcp=mcp, memory=memory, semantic=index)
+    await second.initialize()
+    for text in ["hello", "tell me a joke", "what is the staging server hostname?"]:
+        async for _ in second.chat(text):
+            pass
+
+    messages, system_prompt = llm.calls[-1]
+    assert "orion-7.internal" in system_prompt
+    # Only the recent window is replayed, starting on a user turn
+    assert [m["content"] for m in messages] == ["what is the staging server hostname?"]
+
+    # Scoped to the current conversation, the other one is not recalled
+    monkeypatch.setattr(settings, "SEMANTIC_MEMORY_SCOPE", "conversation")
+    async for _ in second.chat("what is the staging server hostname again?"):
+        pass
+    assert "orion-7.internal" not in llm.calls[-1][1]
+    await index.close()
+
+@pytest.mark.asyncio
+async def test_archive_and_import_keep_index_in_sync(tmp_path, monkeypatch):
+    import aiosqlite
+    from core.memory import vector_index
+
+    monkeypatch.setattr(settings, "SEMANTIC_MEMORY_ENABLED", True)
+    monkeypatch.setattr(settings, "SEMANTIC_MEMORY_PATH", str(tmp_path / "index"))
+    monkeypatch.setattr(vector_index, "_INDEXES", {})
+    memory = MemoryManager(db_path=str(tmp_path / "test.db"), blob_path=str(tmp_path / "blobs"))
+    await memory.init_db()
+    index = vector_index.get_vector_index(settings.SEMANTIC_MEMORY_PATH)
+
+    old_id = await memory.create_conversation("Old")
+    await memory.add_message(old_id, "user", "the backup bucket is named glacier-archive")
+    await memory.index_conversations()
+    assert (await index.search("backup bucket name", k=1))[0]["conversation_id"] == old_id
+    lines = [line async for line in memory.export_conversations()]
+
+    # Archived conversations are no longer recalled
+    async with aiosqlite.connect(memory.db_path) as db:
+        await db.execute("UPDATE messages SET created_at = datetime('now', '-40 days')")
+        await db.commit()
+    assert await memory.archive_conversations(30, str(tmp_path / "archive.ndjson.gz")) == 1
+    assert await index.search("backup bucket name", k=1) == []
+
+    # Imported conversations are indexed under their new ids
+    assert await memory.import_conversations(lines) == 1
+    new_id = (await memory.list_conversations())[0]["id"]
+    assert (await index.search("backup bucket name", k=1))[0]["conversation_id"] == new_id